@@ -1,7 +1,115 @@
+import collections
 import json
 import warnings
 
 import numpy as np
+try:
+    from numba import njit
+except ModuleNotFoundError:
+    njit = None
+try:
+    import scipy.fft as scipy_fft
+except ModuleNotFoundError:
+    scipy_fft = None
+
+# above this many candidate G-points, use the compiled loop (if numba is
+# available) rather than materializing the dense candidate grid
+_NUMBA_G_POINTS_THRESHOLD = 2000000
+
+if njit is not None:
+    @njit(cache=True)
+    def _generate_G_points_numba(nbmax, kpoint, b, encut, C, gamma):
+        """
+        Compiled version of the WaveTrans G-point loop, returning the
+        integer (k1, j2, i3) values of the G-points below the cutoff.
+
+        The loop is done twice, once to count and once to fill, so that
+        the dense candidate grid is never allocated.
+        """
+        if gamma:
+            kmax = nbmax[0] + 1
+        else:
+            kmax = 2 * nbmax[0] + 1
+        cutoff2 = encut * C
+        b00, b01, b02 = b[0, 0], b[0, 1], b[0, 2]
+        b10, b11, b12 = b[1, 0], b[1, 1], b[1, 2]
+        b20, b21, b22 = b[2, 0], b[2, 1], b[2, 2]
+
+        buf = np.empty((0, 3), dtype=np.int32)
+        for fill in (False, True):
+            n = 0
+            for i in range(2 * nbmax[2] + 1):
+                i3 = i - 2 * nbmax[2] - 1 if i > nbmax[2] else i
+                vz = i3 + kpoint[2]
+                for j in range(2 * nbmax[1] + 1):
+                    j2 = j - 2 * nbmax[1] - 1 if j > nbmax[1] else j
+                    vy = j2 + kpoint[1]
+                    for k in range(kmax):
+                        k1 = k - 2 * nbmax[0] - 1 if k > nbmax[0] else k
+                        if gamma and k1 == 0 and (j2 < 0 or (j2 == 0 and i3 < 0)):
+                            continue
+                        vx = k1 + kpoint[0]
+                        gx = vx * b00 + vy * b10 + vz * b20
+                        gy = vx * b01 + vy * b11 + vz * b21
+                        gz = vx * b02 + vy * b12 + vz * b22
+                        if gx * gx + gy * gy + gz * gz < cutoff2:
+                            if fill:
+                                buf[n, 0] = k1
+                                buf[n, 1] = j2
+                                buf[n, 2] = i3
+                            n += 1
+            if not fill:
+                buf = np.empty((n, 3), dtype=np.int32)
+        return buf
+else:
+    _generate_G_points_numba = None
+
+def ifftn(a, axes=None):
+    """
+    Inverse fft of a (e.g. a mesh from Wavecar.fft_mesh), multithreaded with
+    scipy if available, otherwise falling back to numpy. The input may be
+    overwritten.
+
+    Args:
+        a (np.array): the array to transform
+        axes (tuple(int)): the axes to transform over (default all)
+    Returns:
+        the complex transformed array
+    """
+    if scipy_fft is not None:
+        return scipy_fft.ifftn(a, axes=axes, workers=-1, overwrite_x=True)
+    else:
+        return np.fft.ifftn(a, axes=axes)
+
+class _LazyCoeffs:
+    """
+    List-like stand-in for Wavecar.coeffs (of one spin) when the Wavecar is
+    created with lazy=True.
+
+    The coefficients of a k-point are read from the file when first indexed,
+    and the most recently used k-points are kept in memory.
+    """
+
+    def __init__(self, wavecar, ispin, maxsize=8):
+        self._wavecar = wavecar
+        self._ispin = ispin
+        self._maxsize = maxsize
+        self._cache = collections.OrderedDict()
+
+    def __len__(self):
+        return self._wavecar.nk
+
+    def __getitem__(self, ink):
+        if ink in self._cache:
+            self._cache.move_to_end(ink)
+            return self._cache[ink]
+        mm = np.memmap(self._wavecar.filename, dtype=np.float64, mode='r')
+        data = self._wavecar._read_coeffs(mm, self._ispin, ink)
+        del mm
+        self._cache[ink] = data
+        if len(self._cache) > self._maxsize:
+            self._cache.popitem(last=False)
+        return data
 
 class Wavecar:
     """
@@ -72,7 +180,24 @@ class Wavecar:
         and therefore are identical for each band at the same k-point. Each
         G-point is represented by integer multipliers (e.g. assuming
         Gpoints[kp][n] == [n_1, n_2, n_3], then
-        G_n = n_1*b_1 + n_2*b_2 + n_3*b_3)
+        G_n = n_1*b_1 + n_2*b_2 + n_3*b_3). The multipliers are stored as
+        int16, and each self.Gpoints[kp] is a view into G_all.
+
+    .. attribute:: G_all
+
+        The G-points of all k-points in a single (sum of nplane, 3) int16
+        array, with the G-points of k-point kp in rows
+        G_offsets[kp]:G_offsets[kp+1]
+
+    .. attribute:: G_offsets
+
+        The offsets of each k-point's G-points in G_all (length nk + 1)
+
+    .. attribute:: Gcart
+
+        The list of Cartesian k + G vectors for each k-point (e.g.
+        self.Gcart[kp][n] == (self.kpoints[kp] + self.Gpoints[kp][n]) . b),
+        or None unless the Wavecar was created with cache_gcart=True
 
     .. attribute:: coeffs
 
@@ -80,7 +205,15 @@ class Wavecar:
         the wavefunction. For non-spin-polarized, the first index corresponds
         to the kpoint and the second corresponds to the band (e.g.
         self.coeffs[kp][b] corresponds to k-point kp and band b). For
-        spin-polarized calculations, the first index is for the spin.
+        spin-polarized calculations, the first index is for the spin. The
+        coefficients of all bands at one k-point are stored as a single
+        contiguous array (e.g. self.coeffs[kp] has shape (nb, nplane)). If
+        the Wavecar was created with half_precision_coeffs=True, each array
+        instead holds interleaved real and imaginary parts as float16 (shape
+        (nb, 2*nplane)), and _get_coeffs should be used to get complex values.
+        If the Wavecar was created with lazy=True, each spin's list is
+        replaced by an object that is indexed the same way but reads the
+        coefficients of a k-point from the file when they are first used.
 
     Acknowledgments:
         This code is based upon the Fortran program, WaveTrans, written by
@@ -91,7 +224,8 @@ class Wavecar:
     Author: Mark Turiansky
     """
 
-    def __init__(self, filename='WAVECAR', verbose=False, precision='normal', gamma=None):
+    def __init__(self, filename='WAVECAR', verbose=False, precision='normal', gamma=None,
+                 cache_gcart=False, half_precision_coeffs=False, lazy=False):
         """
         Information is extracted from the given WAVECAR
 
@@ -100,169 +234,247 @@ class Wavecar:
             verbose (bool): determines whether processing information is shown
             precision (str): determines how fine the fft mesh is (normal or
                              accurate), only the first letter matters
+            cache_gcart (bool): store the Cartesian k + G vectors of each
+                             k-point (see Gcart), which speeds up
+                             evaluate_wavefunc at the cost of 24 bytes per
+                             plane wave (default False, since fft_mesh
+                             does not use them)
+            half_precision_coeffs (bool): store coefficients as pairs of
+                             float16 (see coeffs), halving their memory at
+                             the cost of only ~3 significant digits, which is
+                             adequate for visualization
+            lazy (bool): only read the header information and G-points, and
+                             read the coefficients of each k-point from the
+                             file when they are first used, keeping only the
+                             most recently used ones in memory
         """
         self.filename = filename
 
         # c = 0.26246582250210965422
         # 2m/hbar^2 in agreement with VASP
         self._C = 0.262465831
-        with open(self.filename, 'rb') as f:
-            # read the header information
-            recl, spin, rtag = np.fromfile(f, dtype=np.float64, count=3) \
-                .astype(np.int)
-            if verbose:
-                print('recl={}, spin={}, rtag={}'.format(recl, spin, rtag))
-            recl8 = int(recl / 8)
-            self.spin = spin
-
-            # check that ISPIN wasn't set to 2
-            # if spin == 2:
-            #     raise ValueError('spin polarization not currently supported')
-
-            # check to make sure we have precision correct
-            if rtag != 45200 and rtag != 45210 and rtag != 53300 and rtag != 53310:
-                # note that rtag=45200 and 45210 may not work if file was actually
-                # generated by old version of VASP, since that would write eigenvalues
-                # and occupations in way that does not span FORTRAN records, but
-                # reader below appears to assume that record boundaries can be ignored
-                # (see OUTWAV vs. OUTWAV_4 in vasp fileio.F)
-                raise ValueError('invalid rtag of {}'.format(rtag))
-
-            # padding to end of fortran REC=1
-            np.fromfile(f, dtype=np.float64, count=(recl8 - 3))
-
-            # extract kpoint, bands, energy, and lattice information
-            self.nk, self.nb, self.encut = np.fromfile(f, dtype=np.float64,
-                                                       count=3).astype(np.int)
-            self.a = np.fromfile(f, dtype=np.float64, count=9).reshape((3, 3))
-            self.efermi = np.fromfile(f, dtype=np.float64, count=1)[0]
+        # map the whole file, records are then sliced out of it by offset
+        # (in units of float64 words), so padding is never read
+        mm = np.memmap(self.filename, dtype=np.float64, mode='r')
+
+        # read the header information
+        recl, spin, rtag = mm[0:3].astype(np.int64)
+        if verbose:
+            print('recl={}, spin={}, rtag={}'.format(recl, spin, rtag))
+        recl8 = int(recl / 8)
+        self.spin = spin
+        self._rtag = rtag
+        self._recl8 = recl8
+        self._half_precision_coeffs = half_precision_coeffs
+
+        # check that ISPIN wasn't set to 2
+        # if spin == 2:
+        #     raise ValueError('spin polarization not currently supported')
+
+        # check to make sure we have precision correct
+        if rtag != 45200 and rtag != 45210 and rtag != 53300 and rtag != 53310:
+            # note that rtag=45200 and 45210 may not work if file was actually
+            # generated by old version of VASP, since that would write eigenvalues
+            # and occupations in way that does not span FORTRAN records, but
+            # reader below appears to assume that record boundaries can be ignored
+            # (see OUTWAV vs. OUTWAV_4 in vasp fileio.F)
+            raise ValueError('invalid rtag of {}'.format(rtag))
+
+        # extract kpoint, bands, energy, and lattice information from fortran REC=2
+        pos = recl8
+        self.nk, self.nb, self.encut = mm[pos:pos + 3].astype(np.int64)
+        self.a = np.array(mm[pos + 3:pos + 12]).reshape((3, 3))
+        self.efermi = float(mm[pos + 12])
+        if verbose:
+            print('kpoints = {}, bands = {}, energy cutoff = {}, fermi '
+                  'energy= {:.04f}\n'.format(self.nk, self.nb, self.encut,
+                                             self.efermi))
+            print('primitive lattice vectors = \n{}'.format(self.a))
+
+        self.vol = np.dot(self.a[0, :],
+                          np.cross(self.a[1, :], self.a[2, :]))
+        if verbose:
+            print('volume = {}\n'.format(self.vol))
+
+        # calculate reciprocal lattice
+        b = np.array([np.cross(self.a[1, :], self.a[2, :]),
+                      np.cross(self.a[2, :], self.a[0, :]),
+                      np.cross(self.a[0, :], self.a[1, :])])
+        b = 2 * np.pi * b / self.vol
+        self.b = b
+        if verbose:
+            print('reciprocal lattice vectors = \n{}'.format(b))
+            print('reciprocal lattice vector magnitudes = \n{}\n'
+                  .format(np.linalg.norm(b, axis=1)))
+
+        # calculate maximum number of b vectors in each direction
+        self._generate_nbmax()
+        if verbose:
+            print('max number of G values = {}\n\n'.format(self._nbmax))
+        self.ng = self._nbmax * 3 if precision.lower()[0] == 'n' else \
+            self._nbmax * 4
+        self._mesh_flat = {}
+        self._mesh_flat_ng = None
+
+        # start of fortran REC=3
+        pos = 2 * recl8
+
+        # reading records
+        # np.set_printoptions(precision=7, suppress=True)
+        self.Gpoints = [None for _ in range(self.nk)]
+        self.kpoints = []
+        if spin == 2:
+            self.coeffs = [[None for j in range(self.nk)] for _ in range(spin)]
+            self.band_energy = [[] for _ in range(spin)]
+        else:
+            self.coeffs = [None for j in range(self.nk)]
+            self.band_energy = []
+        # location (in float64 words) of the first coefficient record of each
+        # spin and k-point, and what is needed to reconstruct the coefficients
+        self._coeff_offset = [[None for j in range(self.nk)] for _ in range(spin)]
+        self._nplane_file = [None for _ in range(self.nk)]
+        self._extra_coeff_inds = [None for _ in range(self.nk)]
+        for ispin in range(spin):
             if verbose:
-                print('kpoints = {}, bands = {}, energy cutoff = {}, fermi '
-                      'energy= {:.04f}\n'.format(self.nk, self.nb, self.encut,
-                                                 self.efermi))
-                print('primitive lattice vectors = \n{}'.format(self.a))
+                print('reading spin {}'.format(ispin))
+            for ink in range(self.nk):
+                # information for this kpoint
+                nplane = int(mm[pos])
+                kpoint = np.array(mm[pos + 1:pos + 4])
 
-            self.vol = np.dot(self.a[0, :],
-                              np.cross(self.a[1, :], self.a[2, :]))
-            if verbose:
-                print('volume = {}\n'.format(self.vol))
-
-            # calculate reciprocal lattice
-            b = np.array([np.cross(self.a[1, :], self.a[2, :]),
-                          np.cross(self.a[2, :], self.a[0, :]),
-                          np.cross(self.a[0, :], self.a[1, :])])
-            b = 2 * np.pi * b / self.vol
-            self.b = b
-            if verbose:
-                print('reciprocal lattice vectors = \n{}'.format(b))
-                print('reciprocal lattice vector magnitudes = \n{}\n'
-                      .format(np.linalg.norm(b, axis=1)))
+                if ispin == 0:
+                    self.kpoints.append(kpoint)
+                else:
+                    assert np.allclose(self.kpoints[ink], kpoint)
 
-            # calculate maximum number of b vectors in each direction
-            self._generate_nbmax()
-            if verbose:
-                print('max number of G values = {}\n\n'.format(self._nbmax))
-            self.ng = self._nbmax * 3 if precision.lower()[0] == 'n' else \
-                self._nbmax * 4
+                if verbose:
+                    print('kpoint {: 4} with {: 5} plane waves at {}'
+                          .format(ink, nplane, kpoint))
 
-            # padding to end of fortran REC=2
-            np.fromfile(f, dtype=np.float64, count=recl8 - 13)
+                # energy and occupation information
+                enocc = np.array(mm[pos + 4:pos + 4 + 3 * self.nb]).reshape((self.nb, 3))
+                if spin == 2:
+                    self.band_energy[ispin].append(enocc)
+                else:
+                    self.band_energy.append(enocc)
 
-            # reading records
-            # np.set_printoptions(precision=7, suppress=True)
-            self.Gpoints = [None for _ in range(self.nk)]
-            self.kpoints = []
-            if spin == 2:
-                self.coeffs = [[[None for i in range(self.nb)]
-                                for j in range(self.nk)] for _ in range(spin)]
-                self.band_energy = [[] for _ in range(spin)]
-            else:
-                self.coeffs = [[None for i in range(self.nb)]
-                               for j in range(self.nk)]
-                self.band_energy = []
-            for ispin in range(spin):
                 if verbose:
-                    print('reading spin {}'.format(ispin))
-                for ink in range(self.nk):
-                    # information for this kpoint
-                    nplane = int(np.fromfile(f, dtype=np.float64, count=1)[0])
-                    kpoint = np.fromfile(f, dtype=np.float64, count=3)
-
-                    if ispin == 0:
-                        self.kpoints.append(kpoint)
+                    print("enocc",enocc[:, [0, 2]])
+
+                # skip to end of record(s) that contain nplane, kpoints, evals and occs
+                pos += 4 + 3 * self.nb
+                pos += (-pos) % recl8
+
+                # generate G integers
+                if gamma is not None:
+                    # use it
+                    self.gamma = gamma
+                    (self.Gpoints[ink], extra_gpoints, extra_coeff_inds) = self._generate_G_points(kpoint, gamma)
+                else:
+                    # try assuming a conventional (non-gamma) calculation
+                    self.gamma = False
+                    (self.Gpoints[ink], extra_gpoints, extra_coeff_inds) = self._generate_G_points(kpoint, False)
+                    initial_generated = len(self.Gpoints[ink])
+                if gamma is None and len(self.Gpoints[ink]) != nplane:
+                    # failed with conventional, retry with gamma-only format
+                    self.gamma = True
+                    (self.Gpoints[ink], extra_gpoints, extra_coeff_inds) = self._generate_G_points(kpoint, True)
+                if len(self.Gpoints[ink]) != nplane:
+                    # failed to match number of plane waves for either gamma or non-gamma
+                    if gamma is None:
+                        raise ValueError('failed to generate the correct '
+                                         'number of G points generated non-gamma {} gamma-only {}, read in {}'.format(
+                                             initial_generated, len(self.Gpoints[ink]), nplane))
                     else:
-                        assert np.allclose(self.kpoints[ink], kpoint)
+                        raise ValueError('failed to generate the correct '
+                                         'number of G points generated {} read in {}'.format(
+                                             gamma, len(self.Gpoints[ink]), nplane))
+                if verbose:
+                    print("gamma-only input",gamma,"final",self.gamma)
+
+                self.Gpoints[ink] = np.concatenate((self.Gpoints[ink], extra_gpoints))
 
-                    if verbose:
-                        print('kpoint {: 4} with {: 5} plane waves at {}'
-                              .format(ink, nplane, kpoint))
+                # coefficients, one record per band, are read later (or on demand)
+                self._coeff_offset[ispin][ink] = pos
+                self._nplane_file[ink] = nplane
+                self._extra_coeff_inds[ink] = extra_coeff_inds
+                pos += self.nb * recl8
 
-                    # energy and occupation information
-                    enocc = np.fromfile(f, dtype=np.float64,
-                                        count=3 * self.nb).reshape((self.nb, 3))
+        # pack the G-points of all k-points into one table, with Gpoints[kp]
+        # a view into it
+        self.G_offsets = np.concatenate(([0], np.cumsum([len(G) for G in self.Gpoints])))
+        self.G_all = np.concatenate(self.Gpoints)
+        self.Gpoints = [self.G_all[self.G_offsets[ink]:self.G_offsets[ink + 1]]
+                        for ink in range(self.nk)]
+
+        if lazy:
+            if spin == 2:
+                self.coeffs = [_LazyCoeffs(self, ispin) for ispin in range(spin)]
+            else:
+                self.coeffs = _LazyCoeffs(self, 0)
+        else:
+            for ispin in range(spin):
+                for ink in range(self.nk):
                     if spin == 2:
-                        self.band_energy[ispin].append(enocc)
+                        self.coeffs[ispin][ink] = self._read_coeffs(mm, ispin, ink)
                     else:
-                        self.band_energy.append(enocc)
+                        self.coeffs[ink] = self._read_coeffs(mm, ispin, ink)
 
-                    if verbose:
-                        print("enocc",enocc[:, [0, 2]])
+        del mm
 
-                    # padding to end of record that contains nplane, kpoints, evals and occs
-                    np.fromfile(f, dtype=np.float64, count=(recl8 - 4 - 3 * self.nb) % recl8)
+        if cache_gcart:
+            self.Gcart = [np.dot(self.Gpoints[ink] + self.kpoints[ink], self.b)
+                          for ink in range(self.nk)]
+        else:
+            self.Gcart = None
+            # contraction orders for evaluate_wavefunc, found once for
+            # representative shapes rather than on every call
+            self._einsum_path_eval = {
+                1: np.einsum_path('ni,ij,j->n', self.Gpoints[0], self.b, np.zeros(3),
+                                  optimize='optimal')[0],
+                2: np.einsum_path('ni,ij,mj->nm', self.Gpoints[0], self.b, np.zeros((1, 3)),
+                                  optimize='optimal')[0]}
+
+    def _read_coeffs(self, mm, ispin, ink):
+        """
+        Helper function that reads the coefficients of all bands at one
+        k-point, including the reconstruction of the extra coefficients of
+        gamma-only WAVECARs.
 
-                    # generate G integers
-                    if gamma is not None:
-                        # use it
-                        self.gamma = gamma
-                        (self.Gpoints[ink], extra_gpoints, extra_coeff_inds) = self._generate_G_points(kpoint, gamma)
-                    else:
-                        # try assuming a conventional (non-gamma) calculation
-                        self.gamma = False
-                        (self.Gpoints[ink], extra_gpoints, extra_coeff_inds) = self._generate_G_points(kpoint, False)
-                        initial_generated = len(self.Gpoints[ink])
-                    if gamma is None and len(self.Gpoints[ink]) != nplane:
-                        # failed with conventional, retry with gamma-only format
-                        self.gamma = True
-                        (self.Gpoints[ink], extra_gpoints, extra_coeff_inds) = self._generate_G_points(kpoint, True)
-                    if len(self.Gpoints[ink]) != nplane:
-                        # failed to match number of plane waves for either gamma or non-gamma
-                        if gamma is None:
-                            raise ValueError('failed to generate the correct '
-                                             'number of G points generated non-gamma {} gamma-only {}, read in {}'.format(
-                                                 initial_generated, len(self.Gpoints[ink]), nplane))
-                        else:
-                            raise ValueError('failed to generate the correct '
-                                             'number of G points generated {} read in {}'.format(
-                                                 gamma, len(self.Gpoints[ink]), nplane))
-                    if verbose:
-                        print("gamma-only input",gamma,"final",self.gamma)
-
-                    self.Gpoints[ink] = np.array(self.Gpoints[ink]+extra_gpoints, dtype=np.float64)
-
-                    # extract coefficients
-                    for inb in range(self.nb):
-                        if rtag == 45200 or rtag == 53300:
-                            data = np.fromfile(f, dtype=np.complex64, count=nplane)
-                            np.fromfile(f, dtype=np.float64, count=recl8 - nplane)
-                        elif rtag == 45210 or rtag == 53310:
-                            # this should handle double precision coefficients
-                            # but I don't have a WAVECAR to test it with
-                            data = np.fromfile(f, dtype=np.complex128, count=nplane)
-                            np.fromfile(f, dtype=np.float64, count=recl8 - 2 * nplane)
-
-                        extra_coeffs = []
-                        if len(extra_coeff_inds) > 0:
-                            # reconstruct extra coefficients missing from gamma-only executable WAVECAR
-                            for G_ind in extra_coeff_inds:
-                                # no idea where this factor of sqrt(2) comes from, but empirically
-                                # it appears to be necessary
-                                data[G_ind] /= np.sqrt(2)
-                                extra_coeffs.append(np.conj(data[G_ind]))
-                        if spin == 2:
-                            self.coeffs[ispin][ink][inb] = np.array(list(data)+extra_coeffs, dtype=np.complex64)
-                        else:
-                            self.coeffs[ink][inb] = np.array(list(data) + extra_coeffs, dtype=np.complex128)
+        Args:
+            mm (np.memmap): float64 memory map of the WAVECAR file
+            ispin (int): the index of the spin
+            ink (int): the index of the kpoint
+
+        Returns:
+            an array of shape (nb, nplane) of coefficients (or (nb, 2*nplane)
+            of float16 if half_precision_coeffs was set)
+        """
+        nplane = self._nplane_file[ink]
+        extra_coeff_inds = self._extra_coeff_inds[ink]
+        pos = self._coeff_offset[ispin][ink]
+
+        block = mm[pos:pos + self.nb * self._recl8].reshape((self.nb, self._recl8))
+        if self._rtag == 45200 or self._rtag == 53300:
+            data = np.array(block[:, :nplane].view(np.complex64))
+        elif self._rtag == 45210 or self._rtag == 53310:
+            # this should handle double precision coefficients
+            # but I don't have a WAVECAR to test it with
+            data = np.array(block[:, :2 * nplane].view(np.complex128))
+
+        if len(extra_coeff_inds) > 0:
+            # reconstruct extra coefficients missing from gamma-only executable WAVECAR
+            # no idea where this factor of sqrt(2) comes from, but empirically
+            # it appears to be necessary
+            data[:, extra_coeff_inds] /= np.sqrt(2)
+            data = np.concatenate((data, np.conj(data[:, extra_coeff_inds])), axis=1)
+        if self._half_precision_coeffs:
+            data = data.astype(np.complex64).view(np.float32).astype(np.float16)
+        elif self.spin == 2:
+            data = data.astype(np.complex64)
+        else:
+            data = data.astype(np.complex128)
+        return data
 
     def _generate_nbmax(self):
         """
@@ -275,79 +487,127 @@ class Wavecar:
         """
         bmag = np.linalg.norm(self.b, axis=1)
         b = self.b
+        gmax = np.sqrt(self.encut * self._C)
+
+        # cross products of pairs of b vectors, computed once, and the
+        # reciprocal cell volume, which is |b_k . (b_i x b_j)| for any k, i, j
+        c12 = np.cross(b[0, :], b[1, :])
+        c13 = np.cross(b[0, :], b[2, :])
+        c23 = np.cross(b[1, :], b[2, :])
+        c12mag, c13mag, c23mag = np.linalg.norm([c12, c13, c23], axis=1)
+        vol_recip = np.abs(np.dot(b[0, :], c23))
+
+        # |sin| of angle between pairs of b vectors
+        sphi12 = c12mag / (bmag[0] * bmag[1])
+        sphi13 = c13mag / (bmag[0] * bmag[2])
+        sphi23 = c23mag / (bmag[1] * bmag[2])
 
         # calculate maximum integers in each direction for G
-        phi12 = np.arccos(np.dot(b[0, :], b[1, :]) / (bmag[0] * bmag[1]))
-        sphi123 = np.dot(b[2, :], np.cross(b[0, :], b[1, :])) / (bmag[2] * np.linalg.norm(np.cross(b[0, :], b[1, :])))
-        nbmaxA = np.sqrt(self.encut * self._C) / bmag
-        nbmaxA[0] /= np.abs(np.sin(phi12))
-        nbmaxA[1] /= np.abs(np.sin(phi12))
-        nbmaxA[2] /= np.abs(sphi123)
-        nbmaxA += 1
-
-        phi13 = np.arccos(np.dot(b[0, :], b[2, :]) / (bmag[0] * bmag[2]))
-        sphi123 = np.dot(b[1, :], np.cross(b[0, :], b[2, :])) / (bmag[1] * np.linalg.norm(np.cross(b[0, :], b[2, :])))
-        nbmaxB = np.sqrt(self.encut * self._C) / bmag
-        nbmaxB[0] /= np.abs(np.sin(phi13))
-        nbmaxB[1] /= np.abs(sphi123)
-        nbmaxB[2] /= np.abs(np.sin(phi13))
-        nbmaxB += 1
-
-        phi23 = np.arccos(np.dot(b[1, :], b[2, :]) / (bmag[1] * bmag[2]))
-        sphi123 = np.dot(b[0, :], np.cross(b[1, :], b[2, :])) / (bmag[0] * np.linalg.norm(np.cross(b[1, :], b[2, :])))
-        nbmaxC = np.sqrt(self.encut * self._C) / bmag
-        nbmaxC[0] /= np.abs(sphi123)
-        nbmaxC[1] /= np.abs(np.sin(phi23))
-        nbmaxC[2] /= np.abs(np.sin(phi23))
-        nbmaxC += 1
-
-        self._nbmax = np.max([nbmaxA, nbmaxB, nbmaxC], axis=0).astype(np.int)
+        nbmaxA = gmax / bmag / [sphi12, sphi12, vol_recip / (bmag[2] * c12mag)] + 1
+        nbmaxB = gmax / bmag / [sphi13, vol_recip / (bmag[1] * c13mag), sphi13] + 1
+        nbmaxC = gmax / bmag / [vol_recip / (bmag[0] * c23mag), sphi23, sphi23] + 1
+
+        self._nbmax = np.max([nbmaxA, nbmaxB, nbmaxC], axis=0).astype(np.int64)
 
     def _generate_G_points(self, kpoint, gamma=False):
         """
         Helper function to generate G-points based on nbmax.
 
-        This function iterates over possible G-point values and determines
-        if the energy is less than G_{cut}. Valid values are appended to
-        the output array. This function should not be called outside of
-        initialization.
+        This function builds the full grid of possible G-point values and
+        keeps those whose energy is less than G_{cut}, in the same order as
+        the nested loops of WaveTrans (k1 fastest, i3 slowest). This function
+        should not be called outside of initialization.
 
         Args:
             kpoint (np.array): the array containing the current k-point value
 
         Returns:
-            a list containing valid G-points
+            a tuple of (valid G-points, extra G-points, indices of the
+            coefficients that the extra G-points are conjugates of)
         """
 
+        def _wrapped_range(nmax, n):
+            # 0, 1, ..., nmax, -nmax, ..., -1 (first n values)
+            return (np.arange(n) + nmax) % (2 * nmax + 1) - nmax
+
         if gamma:
             kmax = self._nbmax[0] + 1
         else:
             kmax = 2 * self._nbmax[0] + 1
 
-        gpoints = []
-        extra_gpoints = []
-        extra_coeff_inds = []
-        G_ind = 0
-        for i in range(2 * self._nbmax[2] + 1):
-            i3 = i - 2 * self._nbmax[2] - 1 if i > self._nbmax[2] else i
-            for j in range(2 * self._nbmax[1] + 1):
-                j2 = j - 2 * self._nbmax[1] - 1 if j > self._nbmax[1] else j
-                for k in range(kmax):
-                    k1 = k - 2 * self._nbmax[0] - 1 if k > self._nbmax[0] else k
-                    if gamma and ((k1 == 0 and j2 < 0) or (k1 == 0 and j2 == 0 and i3 < 0)):
-                        continue
-                    G = np.array([k1, j2, i3])
-                    v = kpoint + G
-                    g = np.linalg.norm(np.dot(v, self.b))
-                    E = g ** 2 / self._C
-                    if E < self.encut:
-                        gpoints.append(G)
-                        if gamma and (k1,j2,i3) != (0,0,0):
-                            extra_gpoints.append(-G)
-                            extra_coeff_inds.append(G_ind)
-                        G_ind += 1
+        n_candidates = (2 * self._nbmax[2] + 1) * (2 * self._nbmax[1] + 1) * kmax
+        if _generate_G_points_numba is not None and n_candidates > _NUMBA_G_POINTS_THRESHOLD:
+            gpoints = _generate_G_points_numba(self._nbmax, np.asarray(kpoint, dtype=np.float64),
+                                               self.b, float(self.encut), self._C, bool(gamma))
+            gpoints = gpoints.astype(np.int16)
+        else:
+            i3 = _wrapped_range(self._nbmax[2], 2 * self._nbmax[2] + 1)
+            j2 = _wrapped_range(self._nbmax[1], 2 * self._nbmax[1] + 1)
+            k1 = _wrapped_range(self._nbmax[0], kmax)
+            grid = np.stack(np.meshgrid(i3, j2, k1, indexing='ij'), -1).reshape(-1, 3)
+            G = grid[:, ::-1]
+
+            v = kpoint + G
+            vb = np.einsum('ni,ij->nj', v, self.b)
+            mask = np.einsum('nj,nj->n', vb, vb) < self.encut * self._C
+            if gamma:
+                mask &= ~((G[:, 0] == 0) & (G[:, 1] < 0))
+                mask &= ~((G[:, 0] == 0) & (G[:, 1] == 0) & (G[:, 2] < 0))
+
+            gpoints = G[mask].astype(np.int16)
+        if gamma:
+            extra_coeff_inds = np.nonzero(np.any(gpoints != 0, axis=1))[0]
+        else:
+            extra_coeff_inds = np.zeros(0, dtype=int)
+        extra_gpoints = -gpoints[extra_coeff_inds]
         return (gpoints, extra_gpoints, extra_coeff_inds)
 
+    def _get_coeffs(self, kpoint, band, spin=0):
+        """
+        Helper function that returns the complex coefficients of one band
+        (or several) at a k-point, converting from half precision storage if
+        needed.
+
+        Args:
+            kpoint (int): the index of the kpoint
+            band (int or list(int)): the index (or indices) of the band
+            spin (int):  spin index (only for ISPIN = 2, default = 0)
+
+        Returns:
+            a complex array of shape (nplane,) for one band, or
+            (len(band), nplane) for a list of bands
+        """
+        c = self.coeffs[spin][kpoint] if self.spin == 2 else \
+            self.coeffs[kpoint]
+        c = c[band]
+        if c.dtype == np.float16:
+            c = c.astype(np.float32).view(np.complex64)
+        return c
+
+    def _get_mesh_flat(self, kpoint):
+        """
+        Helper function that returns the flat (C order) indices of the
+        G-points of a k-point on the (centered) fft mesh.
+
+        The indices are cached per k-point, and the cache is reset whenever
+        self.ng changes (e.g. in get_parchg).
+
+        Args:
+            kpoint (int): the index of the kpoint
+
+        Returns:
+            an (nplane,) integer array of indices into the flattened mesh
+        """
+        if not np.array_equal(self._mesh_flat_ng, self.ng):
+            self._mesh_flat = {}
+            self._mesh_flat_ng = np.array(self.ng).astype(np.int64)
+        if kpoint not in self._mesh_flat:
+            ng = self._mesh_flat_ng
+            idx = self.Gpoints[kpoint].astype(np.int64) + ng // 2
+            flat = (idx[:, 0] * ng[1] + idx[:, 1]) * ng[2] + idx[:, 2]
+            self._mesh_flat[kpoint] = flat.astype(np.int32 if np.prod(ng) < 2**31 else np.int64)
+        return self._mesh_flat[kpoint]
+
     def evaluate_wavefunc(self, kpoint, band, r, spin=0):
         r"""
         Evaluates the wavefunction for a given position, r.
@@ -370,17 +630,33 @@ class Wavecar:
                             will be evaluated
             band (int): the index of the band where the wavefunction will be
                             evaluated
-            r (np.array): the position where the wavefunction will be evaluated
+            r (np.array): the position where the wavefunction will be evaluated,
+                            or an (M, 3) array of M positions
             spin (int):  spin index for the desired wavefunction (only for
                             ISPIN = 2, default = 0)
         Returns:
-            a complex value corresponding to the evaluation of the wavefunction
+            a complex value corresponding to the evaluation of the wavefunction,
+            or an array of M values if M positions were passed in
         """
-        v = self.Gpoints[kpoint] + self.kpoints[kpoint]
-        u = np.dot(np.dot(v, self.b), r)
-        c = self.coeffs[spin][kpoint][band] if self.spin == 2 else \
-            self.coeffs[kpoint][band]
-        return np.sum(np.dot(c, np.exp(1j * u, dtype=np.complex64))) / np.sqrt(self.vol)
+        r = np.asarray(r)
+        if self.Gcart is not None:
+            u = np.dot(self.Gcart[kpoint], r.T)
+        else:
+            v = self.Gpoints[kpoint] + self.kpoints[kpoint]
+            if r.ndim == 1:
+                u = np.einsum('ni,ij,j->n', v, self.b, r,
+                              optimize=self._einsum_path_eval[1])
+            else:
+                u = np.einsum('ni,ij,mj->nm', v, self.b, r,
+                              optimize=self._einsum_path_eval[2])
+        c = self._get_coeffs(kpoint, band, spin=spin)
+        # sum of c * exp(i u) as real products, rather than a complex exp and
+        # complex dot product
+        cr, ci = c.real, c.imag
+        cos_u = np.cos(u).astype(cr.dtype, copy=False)
+        sin_u = np.sin(u).astype(cr.dtype, copy=False)
+        return ((np.dot(cr, cos_u) - np.dot(ci, sin_u)) +
+                1j * (np.dot(cr, sin_u) + np.dot(ci, cos_u))) / np.sqrt(self.vol)
 
     def fft_mesh(self, kpoint, band, spin=0, shift=True):
         """
@@ -406,14 +682,41 @@ class Wavecar:
         Returns:
             a numpy ndarray representing the 3D mesh of coefficients
         """
-        mesh = np.zeros(tuple(self.ng), dtype=np.complex)
-        tcoeffs = self.coeffs[spin][kpoint][band] if self.spin == 2 else \
-            self.coeffs[kpoint][band]
-        for gp, coeff in zip(self.Gpoints[kpoint], tcoeffs):
-            t = tuple(gp.astype(np.int) + (self.ng / 2).astype(np.int))
-            mesh[t] = coeff
+        return self.fft_mesh_batch(kpoint, [band], spin=spin, shift=shift)[0]
+
+    def fft_mesh_batch(self, kpoint, bands, spin=0, shift=True):
+        """
+        Places the coefficients of several wavefunctions at the same k-point
+        onto a stack of fft meshes.
+
+        This is equivalent to calling fft_mesh for each band, but does the
+        placement for all bands at once, and the result can be transformed
+        in a single call, e.g.
+
+            meshes = Wavecar('WAVECAR').fft_mesh_batch(kpoint, bands)
+            evals = np.fft.ifftn(meshes, axes=(-3, -2, -1))
+
+        Args:
+            kpoint (int): the index of the kpoint where the wavefunctions
+                            will be evaluated
+            bands (list(int)): the indices of the bands where the
+                            wavefunctions will be evaluated
+            spin (int):  the spin of the wavefunctions for the desired
+                            wavefunctions (only for ISPIN = 2, default = 0)
+            shift (bool): determines if the zero frequency coefficient is
+                            placed at index (0, 0, 0) or centered
+        Returns:
+            a numpy ndarray of shape (len(bands), *ng) with one 3D mesh of
+            coefficients per band
+        """
+        ng = tuple(int(n) for n in self.ng)
+        # single precision mesh unless the WAVECAR has double precision coefficients
+        dtype = np.complex128 if self._rtag in (45210, 53310) else np.complex64
+        mesh = np.zeros((len(bands),) + ng, dtype=dtype)
+        tcoeffs = self._get_coeffs(kpoint, bands, spin=spin)
+        mesh.reshape((len(bands), -1))[:, self._get_mesh_flat(kpoint)] = tcoeffs.astype(dtype, copy=False)
         if shift:
-            return np.fft.ifftshift(mesh)
+            return np.fft.ifftshift(mesh, axes=(-3, -2, -1))
         else:
             return mesh
 
@@ -425,7 +728,9 @@ class Wavecar:
 
         This function generates a Chgcar object with the charge density of the
         wavefunction specified by band and kpoint (and spin, if the WAVECAR
-        corresponds to a spin-polarized calculation). The phase tag is a
+        corresponds to a spin-polarized calculation). If a list of bands is
+        given, the charge densities of all of them are summed, with the fft
+        done for all bands in one call. The phase tag is a
         feature that is not present in VASP. For a real wavefunction, the phase
         tag being turned on means that the charge density is multiplied by the
         sign of the wavefunction at that point in space. A warning is generated
@@ -439,7 +744,8 @@ class Wavecar:
             poscar (pymatgen.io.vasp.inputs.Poscar): Poscar object that has the
                                 structure associated with the WAVECAR file
             kpoint (int):   the index of the kpoint for the wavefunction
-            band (int):     the index of the band for the wavefunction
+            band (int):     the index of the band for the wavefunction, or
+                                a list of band indices to sum over
             spin (int):     optional argument to specify the spin. If the
                                 Wavecar has ISPIN = 2, spin is None generates a
                                 Chgcar with total spin and magnetization, and
@@ -447,13 +753,37 @@ class Wavecar:
                                 down component.
             phase (bool):   flag to determine if the charge density is
                                 multiplied by the sign of the wavefunction.
-                                Only valid for real wavefunctions.
+                                Only valid for real wavefunctions and a
+                                single band.
             scale (int):    scaling for the FFT grid. The default value of 2 is
                                 at least as fine as the VASP default.
         Returns:
             a pymatgen.io.vasp.outputs.Chgcar object
         """
+        try:
+            from pymatgen.io.vasp.outputs import Chgcar
+        except ModuleNotFoundError as exc:
+            raise ModuleNotFoundError('get_parchg requires pymatgen, use get_parchg_data '
+                                      'for the charge density arrays alone') from exc
+
+        return Chgcar(poscar, self.get_parchg_data(kpoint, band, spin=spin, phase=phase, scale=scale))
+
+    def get_parchg_data(self, kpoint, band, spin=None, phase=False, scale=2):
+        """
+        Computes the charge density of the specified wavefunction(s), as
+        used by get_parchg, without needing pymatgen.
+
+        Args:
+            kpoint, band, spin, phase, scale: as for get_parchg
+        Returns:
+            a dict with the charge density array (shape self.ng * scale) in
+            'total', and for ISPIN = 2 with spin None the magnetization
+            density in 'diff'
+        """
 
+        bands = np.atleast_1d(band)
+        if phase and len(bands) > 1:
+            raise ValueError('phase == True is only valid for a single band')
         if phase and not np.all(self.kpoints[kpoint] == 0.):
             warnings.warn('phase == True should only be used for the Gamma '
                           'kpoint! I hope you know what you\'re doing!')
@@ -461,29 +791,30 @@ class Wavecar:
         # scaling of ng for the fft grid, need to restore value at the end
         temp_ng = self.ng
         self.ng = self.ng * scale
-        N = np.prod(self.ng)
+        N = int(np.prod(self.ng))
+        axes = (-3, -2, -1)
 
         data = {}
         if self.spin == 2:
             if spin is not None:
-                wfr = np.fft.ifftn(self.fft_mesh(kpoint, band, spin=spin)) * N
-                den = np.abs(np.conj(wfr) * wfr)
+                wfr = ifftn(self.fft_mesh_batch(kpoint, bands, spin=spin), axes=axes) * N
+                den = np.sum(wfr.real * wfr.real + wfr.imag * wfr.imag, axis=0)
                 if phase:
-                    den = np.sign(np.real(wfr)) * den
+                    np.copysign(den, wfr[0].real, out=den)
                 data['total'] = den
             else:
-                wfr = np.fft.ifftn(self.fft_mesh(kpoint, band, spin=0)) * N
-                denup = np.abs(np.conj(wfr) * wfr)
-                wfr = np.fft.ifftn(self.fft_mesh(kpoint, band, spin=1)) * N
-                dendn = np.abs(np.conj(wfr) * wfr)
+                wfr = ifftn(self.fft_mesh_batch(kpoint, bands, spin=0), axes=axes) * N
+                denup = np.sum(wfr.real * wfr.real + wfr.imag * wfr.imag, axis=0)
+                wfr = ifftn(self.fft_mesh_batch(kpoint, bands, spin=1), axes=axes) * N
+                dendn = np.sum(wfr.real * wfr.real + wfr.imag * wfr.imag, axis=0)
                 data['total'] = denup + dendn
                 data['diff'] = denup - dendn
         else:
-            wfr = np.fft.ifftn(self.fft_mesh(kpoint, band)) * N
-            den = np.abs(np.conj(wfr) * wfr)
+            wfr = ifftn(self.fft_mesh_batch(kpoint, bands), axes=axes) * N
+            den = np.sum(wfr.real * wfr.real + wfr.imag * wfr.imag, axis=0)
             if phase:
-                den = np.sign(np.real(wfr)) * den
+                np.copysign(den, wfr[0].real, out=den)
             data['total'] = den
 
         self.ng = temp_ng
-        return Chgcar(poscar, data)
+        return data
@@ -12,7 +12,7 @@ def pick_actors(at, actors, point_sets):
         if hasattr(actor, "_vtk_type"):
             if actor._vtk_type in ["image_atom", "atoms_glyphs"]:
                 if "_vtk_picked" not in at.arrays:
-                    at.new_array("_vtk_picked",np.array([False]*len(at)))
+                    at.new_array("_vtk_picked",np.zeros(len(at), dtype=bool))
 
                 if actor._vtk_type == "image_atom":
                     i_at_list = [actor.i_at]
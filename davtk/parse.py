@@ -1,6 +1,7 @@
 from __future__ import print_function
 
-import sys, re, os, types
+import sys, re, os, types, io, threading, queue
+from bisect import bisect_left
 import numpy as np
 import ase.io
 from ase.calculators.vasp import VaspChargeDensity
@@ -10,7 +11,7 @@ except ModuleNotFoundError:
     ffmpeg=None
 import argparse
 
-from davtk.parse_utils import ThrowingArgumentParser, add_material_args_to_parser
+from davtk.parse_utils import ThrowingArgumentParser, ParserEntry, add_material_args_to_parser
 try:
     from davtk.util_global import *
 except ImportError:
@@ -28,26 +29,26 @@ parsers = {}
 def parse_usage(davtk_state, renderer, args):
     print("\nSETTINGS:")
     for keyword in sorted(davtk_state.settings.parsers.keys()):
-        print(keyword, davtk_state.settings.parsers[keyword][1], end='')
+        print(keyword, davtk_state.settings.parsers[keyword].usage, end='')
     print("\nCOMMANDS:")
     for keyword in sorted(parsers.keys()):
-        print(keyword, parsers[keyword][1], end='')
-parsers["usage"] = (parse_usage, "usage: usage\n", "usage: usage\n")
+        print(keyword, parsers[keyword].usage, end='')
+parsers["usage"] = ParserEntry(parse_usage, ThrowingArgumentParser(prog="usage", add_help=False))
 
 def parse_help(davtk_state, renderer, args):
     for keyword in sorted(davtk_state.settings.parsers.keys()):
         print("--------------------------------------------------------------------------------")
-        print(keyword, davtk_state.settings.parsers[keyword][2], end='')
+        print(keyword, davtk_state.settings.parsers[keyword].help, end='')
     for keyword in sorted(parsers.keys()):
         print("--------------------------------------------------------------------------------")
-        print(keyword, parsers[keyword][2], end='')
-parsers["help"] = (parse_help, "usage: help\n", "usage: help\n")
+        print(keyword, parsers[keyword].help, end='')
+parsers["help"] = ParserEntry(parse_help, ThrowingArgumentParser(prog="help", add_help=False))
 
 ################################################################################
 parser_exit = ThrowingArgumentParser(prog="exit",description="end program")
 def parse_exit(davtk_state, renderer, args):
     return "exit"
-parsers["exit"] = (parse_exit, parser_exit.format_usage(), parser_exit.format_help())
+parsers["exit"] = ParserEntry(parse_exit, parser_exit)
 
 parser_write_state = ThrowingArgumentParser(prog="write_state",description="write state of dap, including atomic configs, settings, and view")
 parser_write_state.add_argument("-cur_frame_only",action="store_true")
@@ -73,7 +74,7 @@ def parse_write_state(davtk_state, renderer, args):
         ase.io.write(fout, ats, format=os.path.splitext(args.filename)[1].replace(".",""))
     print("Settings written to '{0}.settings', read back with\n    dap -e \"read {0}.settings\" {0}".format(args.filename))
     return None
-parsers["write_state"] = (parse_write_state, parser_write_state.format_usage(), parser_write_state.format_help())
+parsers["write_state"] = ParserEntry(parse_write_state, parser_write_state)
 
 parser_restore_view = ThrowingArgumentParser(prog="restore_view",description="use stored viewing transform in ASE atoms object")
 group = parser_restore_view.add_mutually_exclusive_group()
@@ -95,7 +96,7 @@ def parse_restore_view(davtk_state, renderer, args):
         else:
             davtk_state.restore_view(davtk_state.saved_views[args.name])
     return None
-parsers["restore_view"] = (parse_restore_view, parser_restore_view.format_usage(), parser_restore_view.format_help(), None)
+parsers["restore_view"] = ParserEntry(parse_restore_view, parser_restore_view)
 
 parser_save_view = ThrowingArgumentParser(prog="save_view",description="store viewing transform in ASE atoms object")
 parser_save_view.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -116,7 +117,7 @@ def parse_save_view(davtk_state, renderer, args):
         davtk_state.saved_views[args.name] = view
 
     return None
-parsers["save_view"] = (parse_save_view, parser_save_view.format_usage(), parser_save_view.format_help(), None)
+parsers["save_view"] = ParserEntry(parse_save_view, parser_save_view)
 
 parser_movie = ThrowingArgumentParser(prog="movie",description="make a movie")
 parser_movie.add_argument("-range",type=str,help="range of configs, in slice format start:[end+1]:[step]",default="::")
@@ -131,15 +132,38 @@ grp.add_argument("-raw_frames", dest="use_ffmpeg", action="store_false", help="S
 parser_movie.add_argument("output_file", type=str, help="Output file name, with ffmpeg-compatible suffix for movie (e.g. .mp4)"
                                                         "or frame-number format substitution (e.g. {:.03d}) and .png suffix for "
                                                         "individual frames")
+# max number of rendered frames waiting for the ffmpeg writer thread
+_MOVIE_QUEUE_SIZE = 4
+def _movie_frame_writer(stdin, frames_queue, errors):
+    # write frames from frames_queue to stdin until None
+    try:
+        while True:
+            data = frames_queue.get()
+            if data is None:
+                break
+            stdin.write(data)
+    except Exception as exc:
+        errors.append(exc)
+        # keep draining so rendering loop never blocks on a full queue
+        while frames_queue.get() is not None:
+            pass
+    finally:
+        # close flushes buffered frames, so for short movies this is where ffmpeg errors show up
+        try:
+            stdin.close()
+        except Exception as exc:
+            errors.append(exc)
+
 def parse_movie(davtk_state, renderer, args):
     args = parser_movie.parse_args(args)
-    m = re.search("^(\d*)(?::(\d*)(?::(\d*))?)?$", args.range)
-    if not m:
+    range_fields = args.range.split(":")
+    if len(range_fields) > 3 or not all([f.isdigit() for f in range_fields if len(f) > 0]):
         raise SyntaxError("range '{}' is not in the expected format".format(args.range))
-    range_start = 0 if m.group(1) is None or len(m.group(1)) == 0 else int(m.group(1))
-    range_end = len(davtk_state.at_list) if m.group(2) is None or len(m.group(2)) == 0 else int(m.group(2))
-    range_interval = 1 if m.group(3) is None or len(m.group(3)) == 0 else int(m.group(3))
-    frames = list(range(range_start, range_end, range_interval))
+    range_fields += [""] * (3 - len(range_fields))
+    range_start = int(range_fields[0]) if len(range_fields[0]) > 0 else 0
+    range_end = int(range_fields[1]) if len(range_fields[1]) > 0 else len(davtk_state.at_list)
+    range_interval = int(range_fields[2]) if len(range_fields[2]) > 0 else 1
+    frames = range(range_start, range_end, range_interval)
 
     if args.use_ffmpeg:
         if ffmpeg is None:
@@ -152,30 +176,55 @@ def parse_movie(davtk_state, renderer, args):
         except IndexError as exc:
             raise RuntimeError('Too many format strings in -output_file "'+args.output_file+'"') from exc
 
-    for frame_i in frames:
-        davtk_state.update(str(frame_i))
-
-        if args.use_ffmpeg:
-            data = davtk_state.snapshot(mag=args.mag).astype(np.uint8)
-            data = np.ascontiguousarray(np.flip(data, axis=0))
-            if frame_i == frames[0]:
-                # start ffmpeg
-                process = (
-                    ffmpeg
-                    .input('pipe:', format='rawvideo', pix_fmt='rgb24', s='{}x{}'.format(data.shape[1],data.shape[0]),
-                           framerate=args.framerate)
-                    .output(args.output_file, pix_fmt='yuv420p', framerate=args.framerate)
-                    .overwrite_output()
-                    .run_async(pipe_stdin=True)
-                )
-
-            process.stdin.write(data)
-        else:
-            davtk_state.snapshot(args.output_file.format(frame_i), mag=args.mag)
-
-    if args.use_ffmpeg:
-        process.stdin.close()
-        process.wait()
+    process = None
+    writer = None
+    try:
+        for frame_i in frames:
+            davtk_state.update_frame(frame_i)
+
+            if args.use_ffmpeg:
+                data = davtk_state.snapshot(mag=args.mag)
+                if process is None:
+                    # start ffmpeg
+                    process = (
+                        ffmpeg
+                        .input('pipe:', format='rawvideo', pix_fmt='rgb24', s='{}x{}'.format(data.shape[1],data.shape[0]),
+                               framerate=args.framerate)
+                        # snapshot rows are bottom to top, let ffmpeg flip rather than copying in python
+                        .output(args.output_file, pix_fmt='yuv420p', framerate=args.framerate, vf='vflip')
+                        .overwrite_output()
+                        .run_async(pipe_stdin=True)
+                    )
+                    # buffer several frames per pipe write
+                    stdin = io.BufferedWriter(process.stdin.raw, buffer_size=max(1 << 20, 2*data.nbytes))
+
+                    # pipe writes happen in a separate thread, overlapping with rendering of the next frame
+                    frames_queue = queue.Queue(maxsize=_MOVIE_QUEUE_SIZE)
+                    writer_errors = []
+                    writer = threading.Thread(target=_movie_frame_writer, args=(stdin, frames_queue, writer_errors),
+                                              daemon=True)
+                    writer.start()
+
+                if len(writer_errors) > 0:
+                    break
+                # each snapshot is a new array, so it can be queued without copying
+                frames_queue.put(np.ascontiguousarray(data, dtype=np.uint8))
+            else:
+                davtk_state.snapshot(args.output_file.format(frame_i), mag=args.mag)
+    finally:
+        # always end the writer and close the pipe, so ffmpeg sees EOF and exits even if rendering failed
+        if writer is not None:
+            frames_queue.put(None)
+            writer.join()
+        elif process is not None:
+            process.stdin.close()
+        if process is not None:
+            process.wait()
+
+    if writer is not None and len(writer_errors) > 0:
+        raise writer_errors[0]
+    if process is not None and process.returncode != 0:
+        raise RuntimeError("ffmpeg failed with exit code {}".format(process.returncode))
 
     # frames.append(frames[-1])
     # fmt_core = "0{}d".format(int(np.log10(len(frames)-1)+1))
@@ -193,31 +242,48 @@ def parse_movie(davtk_state, renderer, args):
         # os.remove(f)
 
     return None
-parsers["movie"] = (parse_movie, parser_movie.format_usage(), parser_movie.format_help())
+parsers["movie"] = ParserEntry(parse_movie, parser_movie)
+
+def _single_int_arg(args, default=None):
+    # fast path for commands with a single int positional arg, None if full argparse parsing is needed
+    if len(args) == 0:
+        return default
+    if len(args) == 1:
+        try:
+            return int(args[0])
+        except ValueError:
+            pass
+    return None
 
 parser_go = ThrowingArgumentParser(prog="go",description="go to a particular frame")
 parser_go.add_argument("n",type=int,help="number of frames to change")
 def parse_go(davtk_state, renderer, args):
-    args = parser_go.parse_args(args)
-    davtk_state.update(str(args.n))
+    n = _single_int_arg(args)
+    if n is None:
+        n = parser_go.parse_args(args).n
+    davtk_state.update(str(n))
     return None
-parsers["go"] = (parse_go, parser_go.format_usage(), parser_go.format_help())
+parsers["go"] = ParserEntry(parse_go, parser_go)
 
 parser_next = ThrowingArgumentParser(prog="next",description="go forward a number of frames")
 parser_next.add_argument("n",type=int,nargs='?',default=0,help="number of frames to change (default set by 'step' command)")
 def parse_next(davtk_state, renderer, args):
-    args = parser_next.parse_args(args)
-    davtk_state.update("+{}".format(args.n if args.n > 0 else davtk_state.settings["frame_step"]))
+    n = _single_int_arg(args, 0)
+    if n is None:
+        n = parser_next.parse_args(args).n
+    davtk_state.update("+{}".format(n if n > 0 else davtk_state.settings["frame_step"]))
     return None
-parsers["next"] = (parse_next, parser_next.format_usage(), parser_next.format_help())
+parsers["next"] = ParserEntry(parse_next, parser_next)
 
 parser_prev = ThrowingArgumentParser(prog="prev", description="go back a number of frames")
 parser_prev.add_argument("n",type=int,nargs='?',default=0, help="number of frames to change (default set by 'step' command)")
 def parse_prev(davtk_state, renderer, args):
-    args = parser_prev.parse_args(args)
-    davtk_state.update("-{}".format(args.n if args.n > 0 else davtk_state.settings["frame_step"]))
+    n = _single_int_arg(args, 0)
+    if n is None:
+        n = parser_prev.parse_args(args).n
+    davtk_state.update("-{}".format(n if n > 0 else davtk_state.settings["frame_step"]))
     return None
-parsers["prev"] = (parse_prev, parser_prev.format_usage(), parser_prev.format_help())
+parsers["prev"] = ParserEntry(parse_prev, parser_prev)
 
 parser_unpick = ThrowingArgumentParser(prog="unpick", description="unpick picked atoms and/or bonds (default both)")
 parser_unpick.add_argument("-all_frames", action="store_true",help="apply to all frames")
@@ -237,11 +303,9 @@ def parse_unpick(davtk_state, renderer, args):
             at.arrays["_vtk_picked"][:] = False
         if none_selected or args.bonds:
             if hasattr(at, "bonds"):
-                for i_at in range(len(at)):
-                    for b in at.bonds[i_at]:
-                        b["picked"] = False
+                at.bonds.unpick_all()
     return "cur"
-parsers["unpick"] = (parse_unpick, parser_unpick.format_usage(), parser_unpick.format_help())
+parsers["unpick"] = ParserEntry(parse_unpick, parser_unpick)
 
 parser_pick = ThrowingArgumentParser(prog="pick", description="pick atom(s) by ID")
 parser_pick.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -255,10 +319,10 @@ def parse_pick(davtk_state, renderer, args):
 
     for at in ats:
         if "_vtk_picked" not in at.arrays:
-            at.new_array("_vtk_picked",np.array([False]*len(at)))
+            at.new_array("_vtk_picked",np.zeros(len(at), dtype=bool))
         at.arrays["_vtk_picked"][args.n] = True
     return "cur"
-parsers["pick"] = (parse_pick, parser_pick.format_usage(), parser_pick.format_help())
+parsers["pick"] = ParserEntry(parse_pick, parser_pick)
 
 parser_delete = ThrowingArgumentParser(prog="delete",description="delete objects (picked by default)")
 parser_delete.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -284,7 +348,7 @@ def parse_delete(davtk_state, renderer, args):
             davtk_state.delete(at, atom_selection="picked", bond_selection="picked")
 
     return "cur"
-parsers["delete"] = (parse_delete, parser_delete.format_usage(), parser_delete.format_help())
+parsers["delete"] = ParserEntry(parse_delete, parser_delete)
 
 parser_supercell = ThrowingArgumentParser(prog="supercell",description="create supercell of current cell")
 parser_supercell.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -318,7 +382,7 @@ def parse_supercell(davtk_state, renderer, args):
 
     davtk_state.supercell(n_dup, wrap, frames=frame_list)
     return None
-parsers["supercell"] = (parse_supercell, parser_supercell.format_usage(), parser_supercell.format_help())
+parsers["supercell"] = ParserEntry(parse_supercell, parser_supercell)
 
 parser_images = ThrowingArgumentParser(prog="images",description="show images of cell")
 parser_images.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -358,7 +422,7 @@ def parse_images(davtk_state, renderer, args):
     davtk_state.update()
 
     return None
-parsers["images"] = (parse_images, parser_images.format_usage(), parser_images.format_help())
+parsers["images"] = ParserEntry(parse_images, parser_images)
 
 parser_vectors = ThrowingArgumentParser(prog="vectors",description="Draw vectors")
 parser_vectors.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -405,7 +469,7 @@ def parse_vectors(davtk_state, renderer, args):
                 if getattr(args,p) is not None:
                     at.info["_vtk_vectors"][p] = getattr(args, p)
     return None
-parsers["vectors"] = (parse_vectors, parser_vectors.format_usage(), parser_vectors.format_help())
+parsers["vectors"] = ParserEntry(parse_vectors, parser_vectors)
 
 parser_bond = ThrowingArgumentParser(prog="bond",description="Create bonds")
 parser_bond.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -489,7 +553,7 @@ def parse_bond(davtk_state, renderer, args):
         return "color_only"
     else:
         return "settings"
-parsers["bond"] = (parse_bond, parser_bond.format_usage(), parser_bond.format_help())
+parsers["bond"] = ParserEntry(parse_bond, parser_bond)
 
 parser_snapshot = ThrowingArgumentParser(prog="snapshot",description="write snapshot")
 parser_snapshot.add_argument("-slice",type=str,help="slice (start:end:step) to generate snapshots for", default=None)
@@ -506,14 +570,14 @@ def parse_snapshot(davtk_state, renderer, args):
             raise RuntimeError('-slice format not [start[:[end][:step]]]')
         range_slice += [None] * (3-len(range_slice))
         for frame_i in range(len(davtk_state.at_list))[slice(*range_slice)]:
-            davtk_state.update(str(frame_i))
+            davtk_state.update_frame(frame_i)
             davtk_state.snapshot(args.file.format(frame_i), args.mag)
     else:
         davtk_state.snapshot(args.file, args.mag)
 
     return None
 
-parsers["snapshot"] = (parse_snapshot, parser_snapshot.format_usage(), parser_snapshot.format_help())
+parsers["snapshot"] = ParserEntry(parse_snapshot, parser_snapshot)
 
 parser_X = ThrowingArgumentParser(prog="X",description="execute python code (Atoms object available as 'atoms', DavTKSettings as 'settings')")
 parser_X.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -529,14 +593,12 @@ def parse_X(davtk_state, renderer, args):
     settings = davtk_state.settings
     import ase
     from ase.io import write
+    code = compile(ase_command, "<X>", "exec")
     for atoms in ats:
         globals()["atoms"] = atoms
-        if args.global_context:
-            exec(ase_command) in globals(), globals()
-        else:
-            exec(ase_command)
+        exec(code)
     return "cur"
-parsers["X"] = (parse_X, parser_X.format_usage(), parser_X.format_help())
+parsers["X"] = ParserEntry(parse_X, parser_X)
 
 parser_read = ThrowingArgumentParser(prog="read",description="read commands from file(s)")
 parser_read.add_argument("filename",type=str,nargs='+',help="filenames")
@@ -544,7 +606,7 @@ def parse_read(davtk_state, renderer, args):
     args = parser_read.parse_args(args)
     for f in args.filename:
         parse_file(f, davtk_state.settings, davtk_state)
-parsers["read"] = (parse_read, parser_read.format_usage(), parser_read.format_help())
+parsers["read"] = ParserEntry(parse_read, parser_read)
 
 parser_override_frame_label = ThrowingArgumentParser(prog="override_frame_label",description="set per-frame label")
 parser_override_frame_label.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -561,7 +623,7 @@ def parse_override_frame_label(davtk_state, renderer, args):
         at.info["_vtk_frame_label_string"] = args.string
 
     return "cur"
-parsers["override_frame_label"] = (parse_override_frame_label, parser_override_frame_label.format_usage(), parser_override_frame_label.format_help())
+parsers["override_frame_label"] = ParserEntry(parse_override_frame_label, parser_override_frame_label)
 
 parser_override_atom_label = ThrowingArgumentParser(prog="override_atom_label",description="override atom label on a per-atom basis")
 parser_override_atom_label.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -578,29 +640,32 @@ def parse_override_atom_label(davtk_state, renderer, args):
     else:
         ats = [davtk_state.cur_at()]
 
+    if args.i:
+        # indices do not depend on atoms, evaluate once
+        inds = [eval(compile("np.s_["+range_item+"]", "<-i>", "eval")) for range_item in args.i.split(",")]
+    elif args.eval:
+        code = compile("np.s_["+" ".join(args.eval)+"]", "<-eval>", "eval")
+
     for at in ats:
         new_label = " ".join(args.string)
-        if "_vtk_label" not in at.arrays or len(new_label) > len(at.arrays["_vtk_label"][0]):
-            a = np.array([" "*len(new_label)]*len(at))
+        # reallocate only when label does not fit in string dtype, with some room to grow
+        if "_vtk_label" not in at.arrays or len(new_label) > at.arrays["_vtk_label"].dtype.itemsize // np.dtype("U1").itemsize:
+            a = np.full(len(at), "", dtype="U{}".format(max(len(new_label), 32)))
             if "_vtk_label" in at.arrays:
                 a[:] = at.arrays["_vtk_label"]
                 del at.arrays["_vtk_label"]
             at.new_array("_vtk_label", a)
         if args.i:
-            for range_item in args.i.split(","):
-                exec('at.arrays["_vtk_label"]['+range_item+'] = new_label')
+            for ind in inds:
+                at.arrays["_vtk_label"][ind] = new_label
         elif args.eval:
-            atoms = at
-            expr = " ".join(args.eval)
-            exec('atoms.arrays["_vtk_label"]['+expr+'] = new_label')
+            at.arrays["_vtk_label"][eval(code, globals(), {"atoms": at})] = new_label
         else: # -picked, or nothing selected (default)
             if "_vtk_picked" not in at.arrays:
                 return None
-            for i_at in range(len(at)):
-                if at.arrays["_vtk_picked"][i_at]:
-                    at.arrays["_vtk_label"][i_at] = new_label
+            at.arrays["_vtk_label"][at.arrays["_vtk_picked"]] = new_label
     return "cur"
-parsers["override_atom_label"] = (parse_override_atom_label, parser_override_atom_label.format_usage(), parser_override_atom_label.format_help())
+parsers["override_atom_label"] = ParserEntry(parse_override_atom_label, parser_override_atom_label)
 
 parser_measure = ThrowingArgumentParser(prog="measure",description="measure some quantities for picked objects (default) or listed atoms")
 parser_measure.add_argument("-all_frames",action="store_true",help="apply to all frames")
@@ -616,7 +681,7 @@ def parse_measure(davtk_state, renderer, args):
         print("Frame:",frame_i)
         davtk_state.measure(args.n, frame_i)
     return None
-parsers["measure"] = (parse_measure, parser_measure.format_usage(), parser_measure.format_help())
+parsers["measure"] = ParserEntry(parse_measure, parser_measure)
 
 # Logic of which arguments can coexist is way too messy here. Not sure how to fix.
 parser_polyhedra = ThrowingArgumentParser(prog="polyhedra",description="draw coordination polyhedra")
@@ -690,7 +755,7 @@ def parse_polyhedra(davtk_state, renderer, args):
         return "cur"
     else:
         return "color_only"
-parsers["polyhedra"] = (parse_polyhedra, parser_polyhedra.format_usage(), parser_polyhedra.format_help())
+parsers["polyhedra"] = ParserEntry(parse_polyhedra, parser_polyhedra)
 
 parser_arb_polyhedra = ThrowingArgumentParser(prog="arb_polyhedra",description="draw arbitrary polyhedra connecting listed atoms")
 parser_arb_polyhedra.add_argument("-all_frames", action="store_true", help="apply to all frames")
@@ -750,7 +815,7 @@ def parse_arb_polyhedra(davtk_state, renderer, args):
         return "cur"
     else:
         return "color_only"
-parsers["arb_polyhedra"] = (parse_arb_polyhedra, parser_arb_polyhedra.format_usage(), parser_arb_polyhedra.format_help())
+parsers["arb_polyhedra"] = ParserEntry(parse_arb_polyhedra, parser_arb_polyhedra)
 
 parser_volume = ThrowingArgumentParser(prog="volume",description="read volumetric data from file")
 parser_volume.add_argument("filename",nargs='?',help="File to read from. Text dap internal format, *.CHGCAR, *.PARCHG, *.WAVECAR, *.cube")
@@ -779,6 +844,54 @@ volume_subparsers["CHGCAR"].add_argument("-component",choices=["total","spin","u
 volume_subparsers["internal"] = ThrowingArgumentParser(prog="file.other -file_args", description="dap internal format specific arguments")
 volume_subparsers["internal"].add_argument("-column", type=int, help="column (after indices) for dap internal text format", default=0)
 
+def _read_vasp_charge_density(filename, read_diff):
+    # fast reader for first charge density (and spin density, if read_diff) in CHGCAR/PARCHG,
+    # normalized by cell volume like VaspChargeDensity, but reading each grid with a single np.fromfile
+    # returns (chg, chgdiff), chgdiff None if not read or not present, with shape (nx, ny, nz)
+    import ase.io.vasp
+
+    def read_grid(fin, ng):
+        grid = np.fromfile(fin, count=np.prod(ng), sep=' ')
+        if grid.size != np.prod(ng):
+            raise ValueError("Got {} grid values, expected {}".format(grid.size, np.prod(ng)))
+        # file order is x fastest
+        return grid.reshape(ng[::-1]).T
+
+    with open(filename) as fin:
+        at = ase.io.vasp.read_vasp_configuration(fin)
+        fin.readline()
+        ngr = fin.readline().split()
+        ng = tuple([int(n) for n in ngr])
+        chg = read_grid(fin, ng) / at.get_volume()
+
+        chgdiff = None
+        if read_diff:
+            # skip augmentation occupancies, if any, until grid dimensions of spin density
+            l = fin.readline()
+            while len(l) > 0:
+                if l.split() == ngr:
+                    chgdiff = read_grid(fin, ng) / at.get_volume()
+                    break
+                l = fin.readline()
+
+    return (chg, chgdiff)
+
+def _read_chgcar(filename, read_diff):
+    # first charge density (and spin density) in CHGCAR/PARCHG, with fast reader if possible
+    # returns (chg, chgdiff) like _read_vasp_charge_density
+    import ase.io.vasp
+
+    # fast reader needs read_vasp_configuration, only present in recent ase
+    if hasattr(ase.io.vasp, "read_vasp_configuration"):
+        try:
+            return _read_vasp_charge_density(filename, read_diff)
+        except (ValueError, KeyError, IndexError, RuntimeError):
+            # fall back to ase for unusually formatted files
+            pass
+
+    chgcar = VaspChargeDensity(filename)
+    return (chgcar.chg[0], chgcar.chgdiff[0] if chgcar.is_spin_polarized() else None)
+
 def parse_volume(davtk_state, renderer, args):
     args_list = args
     args = parser_volume.parse_args(args)
@@ -806,7 +919,7 @@ def parse_volume(davtk_state, renderer, args):
         update_prop(davtk_state.volume_rep_prop[args.name], args)
 
         def normalize(w, to_sqrt=False):
-            norm_factor = np.product(w.shape)/davtk_state.cur_at().get_volume()
+            norm_factor = np.prod(w.shape)/davtk_state.cur_at().get_volume()
             if to_sqrt:
                 w *= np.sqrt(norm_factor)/np.linalg.norm(w)
             else:
@@ -816,18 +929,18 @@ def parse_volume(davtk_state, renderer, args):
             if args.filename.endswith(".CHGCAR") or args.filename.endswith(".PARCHG"):
                 sub_args = volume_subparsers["CHGCAR"].parse_args(args.file_args)
 
-                chgcar = VaspChargeDensity(args.filename)
+                (chg, chgdiff) = _read_chgcar(args.filename, sub_args.component != "total")
                 if sub_args.component == "total":
-                    data = chgcar.chg[0]
+                    data = chg
                 else:
-                    if not chgcar.is_spin_polarized():
+                    if chgdiff is None:
                         raise RuntimeError("no spin-density available for non-spin_polarized calculation")
                     if sub_args.component == "spin":
-                        data = chgcar.chgdiff[0]
+                        data = chgdiff
                     elif sub_args.component == "up":
-                        data = 0.5*(chgcar.chg[0] + chgcar.chgdiff[0])
+                        data = 0.5*(chg + chgdiff)
                     elif sub_args.component == "down":
-                        data = 0.5*(chgcar.chg[0] - chgcar.chgdiff[0])
+                        data = 0.5*(chg - chgdiff)
                     else:
                         raise RuntimeError("volume CHGCAR should never get here")
                 # normalize(data)
@@ -837,20 +950,20 @@ def parse_volume(davtk_state, renderer, args):
 
                 ##
                 ## from pymatgen.io.vasp.outputs import Wavecar
-                from davtk.Wavecar import Wavecar # patched to real from gamma-only runs
+                from davtk.Wavecar import Wavecar, ifftn # patched to real from gamma-only runs
                 ##
                 wf = Wavecar(args.filename) # , verbose=True)
                 is_spin_polarized = wf.spin == 2
                 is_sq_modulus = False
                 if sub_args.component == "total":
                     if is_spin_polarized:
-                        wavecar_0 = np.abs(np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=0)))**2
+                        wavecar_0 = np.abs(ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=0)))**2
                         normalize(wavecar_0)
-                        wavecar_1 = np.abs(np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=1)))**2
+                        wavecar_1 = np.abs(ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=1)))**2
                         normalize(wavecar_1)
                         wavecar = wavecar_0 + wavecar_1
                     else:
-                        wavecar = np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1))
+                        wavecar = ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1))
                         ## # for testing purposes:
                         ## wavecar = np.zeros((20,20,20))
                         ## c = davtk_state.cur_at().get_cell()
@@ -865,17 +978,17 @@ def parse_volume(davtk_state, renderer, args):
                     if not is_spin_polarized:
                         raise RuntimeError("no spin-density available for non-spin_polarized calculation")
                     if sub_args.component == "spin":
-                        wavecar_0 = np.abs(np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=0)))**2
+                        wavecar_0 = np.abs(ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=0)))**2
                         normalize(wavecar_0)
-                        wavecar_1 = np.abs(np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=1)))**2
+                        wavecar_1 = np.abs(ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=1)))**2
                         normalize(wavecar_1)
                         wavecar = wavecar_0 - wavecar_1
                     elif sub_args.component == "up":
-                        wavecar_0 = np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=0))
+                        wavecar_0 = ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=0))
                         normalize(wavecar_0, True)
                         is_sq_modulus = False
                     elif sub_args.component == "down":
-                        wavecar_1 = np.fft.ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=1))
+                        wavecar_1 = ifftn(wf.fft_mesh(sub_args.nk-1, sub_args.nband-1, spin=1))
                         normalize(wavecar_1, True)
                         is_sq_modulus = False
                     else:
@@ -897,19 +1010,19 @@ def parse_volume(davtk_state, renderer, args):
                 with open(args.filename) as fin:
                     extents = [int(i) for i in fin.readline().rstrip().split()]
                     if len(extents) != 3:
-                        raise ValueError("Got bad number of extents {} != 3 on first line of '{}'".format(len(full_extents), filename))
+                        raise ValueError("Got bad number of extents {} != 3 on first line of '{}'".format(len(extents), args.filename))
+
+                    # indices and selected column for all lines at once
+                    fields = np.loadtxt(fin, usecols=(0, 1, 2, 3 + sub_args.column), ndmin=2)
+                    inds = fields[:, 0:3]
+                    # lines with any non-integer index are fractional coordinates
+                    fractional = np.any(inds != np.round(inds), axis=1)
+                    inds[fractional] = np.round(inds[fractional] * extents)
+                    inds = inds.astype(np.intp)
 
                     # order of indices in data is being reversed
                     data = np.zeros(extents[::-1])
-                    for l in fin:
-                        fields = l.rstrip().split()
-                        (i0, i1, i2) = fields[0:3]
-                        v = fields[3 + sub_args.column]
-                        try:
-                            (i0, i1, i2) = (int(i0), int(i1), int(i2))
-                        except:
-                            (i0, i1, i2) = (int(np.round(float(i0)*extents[0])), int(np.round(float(i1)*extents[1])), int(np.round(float(i2)*extents[2])))
-                        data[i2, i1, i0] = float(v)
+                    data[inds[:, 2], inds[:, 1], inds[:, 0]] = fields[:, 3]
 
             if args.isosurface is not None:
                 davtk_state.add_volume_rep(args.name, data, "isosurface", (args.isosurface,), ["volume"] + args_list)
@@ -918,7 +1031,7 @@ def parse_volume(davtk_state, renderer, args):
         # else: just modifying property
 
     return "cur"
-parsers["volume"] = (parse_volume, parser_volume.format_usage(), parser_volume.format_help())
+parsers["volume"] = ParserEntry(parse_volume, parser_volume)
 
 parser_view = ThrowingArgumentParser(prog="view",description="set view position and orientation")
 parser_view.add_argument("-lattice",action='store_true',help="use lattice A1 A2 A3 instead of cartesian X Y Z directions")
@@ -933,7 +1046,7 @@ def parse_view(davtk_state, renderer, args):
     davtk_state.set_view(args.dir, args.lattice, args.mag)
 
     return "settings"
-parsers["view"] = (parse_view, parser_view.format_usage(), parser_view.format_help())
+parsers["view"] = ParserEntry(parse_view, parser_view)
 
 parser_alternate_cell_box = ThrowingArgumentParser(prog="alternate_cell_box",description="alternate (e.g. primitive) cell box to display")
 parser_alternate_cell_box.add_argument("-all_frames", action="store_true",help="apply to all frames")
@@ -966,7 +1079,7 @@ def parse_alternate_cell_box(davtk_state, renderer, args):
             at.info["_vtk_alternate_cell_box"][args.name] = origin
 
     return "cur"
-parsers["alternate_cell_box"] = (parse_alternate_cell_box, parser_alternate_cell_box.format_usage(), parser_alternate_cell_box.format_help())
+parsers["alternate_cell_box"] = ParserEntry(parse_alternate_cell_box, parser_alternate_cell_box)
 
 parser_atom_override_type = ThrowingArgumentParser(prog="atom_override_type",description="override type of an atom")
 parser_atom_override_type.add_argument("-all_frames", action="store_true",help="apply to all frames")
@@ -997,37 +1110,55 @@ def parse_atom_override_type(davtk_state, renderer, args):
         at.arrays["_vtk_override_type"][np.array(args.index)] = args.value
 
     return "cur"
-parsers["atom_override_type"] = (parse_atom_override_type, parser_atom_override_type.format_usage(), parser_atom_override_type.format_help())
+parsers["atom_override_type"] = ParserEntry(parse_atom_override_type, parser_atom_override_type)
 ################################################################################
 
+# sorted keys of each parsers dict, keyed by id(), rebuilt if commands are added
+_sorted_parser_keys = {}
+def _prefix_matches(parsers_dict, prefix):
+    (n_keys, sorted_keys) = _sorted_parser_keys.get(id(parsers_dict), (None, None))
+    if n_keys != len(parsers_dict):
+        sorted_keys = sorted(parsers_dict.keys())
+        _sorted_parser_keys[id(parsers_dict)] = (len(sorted_keys), sorted_keys)
+
+    # keys starting with prefix are contiguous in sorted order, beginning at the insertion point
+    matches = []
+    for k in sorted_keys[bisect_left(sorted_keys, prefix):]:
+        if not k.startswith(prefix):
+            break
+        matches.append(k)
+    return matches
+
+_comment_re = re.compile(r'^\s*#')
 def parse_line(line, settings, state, renderer=None):
-    if re.search('^\s*#', line) or len(line.strip()) == 0:
+    if _comment_re.match(line) or len(line.strip()) == 0:
         return None
 
     args = line.split()
 
-    matches_settings = [ k for k in settings.parsers.keys() if k.startswith(args[0]) ]
-    matches_cmds = [ k for k in parsers.keys() if k.startswith(args[0]) ]
+    # exact matches take precedence over any other prefix matches
+    if args[0] in settings.parsers:
+        return settings.parsers[args[0]].fn(args[1:])
+    if args[0] in parsers:
+        return parsers[args[0]].fn(state, renderer, args[1:])
+
+    matches_settings = _prefix_matches(settings.parsers, args[0])
+    matches_cmds = _prefix_matches(parsers, args[0])
 
     if len(matches_settings+matches_cmds) == 0: # no match
         raise ValueError("Unknown command '{}'\n".format(args[0]))
 
     if len(matches_settings+matches_cmds) == 1: # unique match
         if len(matches_settings) == 1:
-            return settings.parsers[matches_settings[0]][0](args[1:])
+            return settings.parsers[matches_settings[0]].fn(args[1:])
         else: # must be matches_cmds
-            return parsers[matches_cmds[0]][0](state, renderer, args[1:])
-
-    if args[0] in matches_settings:
-        return settings.parsers[args[0]][0](args[1:])
-    if args[0] in matches_cmds:
-        return parsers[args[0]][0](state, renderer, args[1:])
+            return parsers[matches_cmds[0]].fn(state, renderer, args[1:])
 
     raise ValueError("Ambiguous command '{}', matches {}".format(args[0], matches_settings+matches_cmds))
 
 def parse_file(filename, settings, state=None):
     with open(filename) as fin:
-        for l in fin.readlines():
+        for l in fin:
             refresh = parse_line(l, settings, state)
             if state is not None:
                 state.update(refresh)
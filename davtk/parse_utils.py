@@ -1,5 +1,6 @@
 from __future__ import print_function
-import argparse
+import argparse, copy
+from functools import cached_property
 
 # subclass ArgumentParser to throw errors instead of exiting
 class ArgumentParserError(Exception):
@@ -8,11 +9,47 @@ class ArgumentParserHelp(Exception):
     pass
 
 class ThrowingArgumentParser(argparse.ArgumentParser):
+    # max number of distinct argument lists with parse results kept for reuse
+    parse_cache_size = 256
+
+    def __init__(self, *args, **kwargs):
+        super(ThrowingArgumentParser, self).__init__(*args, **kwargs)
+        self._parse_cache = {}
+
     def error(self, message):
         raise ArgumentParserError(message)
     def exit(self):
         raise ArgumentParserHelp("help")
 
+    def parse_args(self, args=None, namespace=None):
+        # repeated command lines (e.g. settings files that are read many times) skip argparse parsing
+        if args is None or namespace is not None:
+            return super(ThrowingArgumentParser, self).parse_args(args, namespace)
+        key = tuple(args)
+        if key not in self._parse_cache:
+            if len(self._parse_cache) >= self.parse_cache_size:
+                self._parse_cache.clear()
+            self._parse_cache[key] = super(ThrowingArgumentParser, self).parse_args(args)
+        # copy, since callers may modify parsed lists
+        return argparse.Namespace(**{k : copy.deepcopy(v) if isinstance(v, list) else v
+                                     for (k, v) in vars(self._parse_cache[key]).items()})
+
+# entry in a parsers dict: parse function, usage and help (formatted only when first needed),
+# and optional settings writer
+class ParserEntry(object):
+    def __init__(self, fn, parser, writer=None):
+        self.fn = fn
+        self.parser = parser
+        self.writer = writer
+
+    @cached_property
+    def usage(self):
+        return self.parser.format_usage()
+
+    @cached_property
+    def help(self):
+        return self.parser.format_help()
+
 def material_dict_from_args(args):
     d = {}
     for f in ["opacity", "specular", "specular_radius", "ambient"]:
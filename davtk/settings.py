@@ -1,19 +1,39 @@
 from __future__ import print_function
 import argparse, numpy as np, vtk
 import re, sys
-from davtk.parse_utils import ThrowingArgumentParser, write_material_args, add_material_args_to_parser
+from davtk.parse_utils import ThrowingArgumentParser, ParserEntry, write_material_args, add_material_args_to_parser
 from davtk.vtk_utils import update_prop
-import types
-
-def piecewise_linear(x, t):
-    i = np.searchsorted(t[::4], x)
-    if i == 0:
-        return t[1:4]
-    elif i == len(t)/4:
-        return t[-3:]
-    else:
-        f = t[i*4]-x
-        return f*t[(i-1)*4+1:(i-1)*4+4] + (1.0-f)*t[i*4+1:i*4+4]
+
+class Colormap(object):
+    # sequence of V R G B points, sorted by V once at creation
+    def __init__(self, points):
+        points = np.array(points, dtype=float).reshape((-1, 4))
+        self.points = points[np.argsort(points[:, 0], kind="stable")]
+
+    def __len__(self):
+        return len(self.points)
+
+    def __getitem__(self, key):
+        return self.points[key]
+
+    def __iter__(self):
+        return iter(self.points)
+
+class DavTKAtomType(object):
+    __slots__ = ("color", "colormap", "radius", "radius_field", "opacity", "specular", "specular_radius", "ambient",
+                 "bonding_radius", "prop")
+
+    def __init__(self):
+        self.color = None
+        self.colormap = None
+        self.radius = None
+        self.radius_field = None
+        self.opacity = 1.0
+        self.specular = 0.8
+        self.specular_radius = 0.1
+        self.ambient = 0.3
+        self.bonding_radius = None
+        self.prop = vtk.vtkProperty()
 
 class DavTKAtomTypes(object):
     def __init__(self):
@@ -45,153 +65,168 @@ class DavTKAtomTypes(object):
         data = {}
         for name in self.types:
             t = self.types[name]
-            data[name] = (t["color"],t["colormap"],t["radius"],t["radius_field"],
-                          {k : t[k] for k in ["opacity","specular","specular_radius","ambient"]},
-                          t["bonding_radius"])
+            data[name] = (t.color,t.colormap,t.radius,t.radius_field,
+                          {k : getattr(t, k) for k in ["opacity","specular","specular_radius","ambient"]},
+                          t.bonding_radius)
         return data
 
     def set_type(self, name, color=None, colormap=None, radius=None, radius_field=None,
                  specular=None, specular_radius=None, ambient=None, opacity=None,
                  bonding_radius=None):
         if name not in self.types:
-            self.types[name] = {}
-            self.types[name]["color"] = None
-            self.types[name]["colormap"] = None
-            self.types[name]["radius"] = None
-            self.types[name]["radius_field"] = None
-            self.types[name]["opacity"] = 1.0
-            self.types[name]["specular"] = 0.8
-            self.types[name]["specular_radius"] = 0.1
-            self.types[name]["ambient"] = 0.3
-            self.types[name]["bonding_radius"] = None
-            self.types[name]["prop"] = vtk.vtkProperty()
+            self.types[name] = DavTKAtomType()
+        t = self.types[name]
         if color is not None:
             if colormap is not None:
                 raise ValueError("got color and colormap")
-            self.types[name]["color"] = color
-            self.types[name]["colormap"] = None
+            t.color = color
+            t.colormap = None
         if specular is not None:
-            self.types[name]["specular"] = specular
+            t.specular = specular
         if specular_radius is not None:
-            self.types[name]["specular_radius"] = specular_radius
+            t.specular_radius = specular_radius
         if ambient is not None:
-            self.types[name]["ambient"] = ambient
+            t.ambient = ambient
         if colormap is not None:
             if color is not None:
                 raise ValueError("got color and colormap")
-            self.types[name]["colormap"] = (colormap[0], colormap[1])
-            self.types[name]["color"] = None
+            t.colormap = (colormap[0], colormap[1])
+            t.color = None
         if radius is not None:
             if radius_field is not None:
                 raise ValueError("got radius and radius_field")
-            self.types[name]["radius"] = radius
-            self.types[name]["radius_field"] = None
+            t.radius = radius
+            t.radius_field = None
         if radius_field is not None:
             if radius is not None:
                 raise ValueError("got radius_field and radius")
-            self.types[name]["radius_field"] = radius_field
-            self.types[name]["radius"] = None
+            t.radius_field = radius_field
+            t.radius = None
         if opacity is not None:
-            self.types[name]["opacity"] = opacity
+            t.opacity = opacity
         if bonding_radius is not None:
-            self.types[name]["bonding_radius"] = bonding_radius
-
-        update_prop(self.types[name]["prop"], types.SimpleNamespace(**self.types[name]))
+            t.bonding_radius = bonding_radius
+
+        update_prop(t.prop, t)
+
+# command grammar is static, so parsers are built once and shared by all DavTKSettings instances
+def _build_parsers():
+    parsers = {}
+
+    parsers["atom_type_field"] = ThrowingArgumentParser(prog="atom_type_field",description="ASE at.arrays field to use for atom type")
+    parsers["atom_type_field"].add_argument("field",type=str,help="name of field ('Z' for atomic numbers, 'species' for chemical symbols", default='Z')
+
+    parsers["print_settings"] = ThrowingArgumentParser(prog="print_settings",description="print settings")
+    parsers["print_settings"].add_argument("-keyword_regexp",type=str)
+
+    parsers["legend"] = ThrowingArgumentParser(prog="legend",description="control legend, toggle by default")
+    group = parsers["legend"].add_mutually_exclusive_group()
+    group.add_argument("-on",action='store_true',help="enable legend")
+    group.add_argument("-off",action='store_true',help="disable legend")
+    group = parsers["legend"].add_mutually_exclusive_group()
+    group.add_argument("-position",type=int,nargs=2,help="position relative to bottom left corner of display"+
+                                                         " (negative values relative to top right)", default=None)
+    group.add_argument("-offset",type=int,nargs=2,help="offset relative to current position", default=None)
+    parsers["legend"].add_argument("-spacing",type=float,help="multiplier for spacing between rows", default=None)
+    parsers["legend"].add_argument("-sphere_scale",action='store',type=float,help="scaling factor for sphere radius", default=None)
+
+    parsers["step"] = ThrowingArgumentParser(prog="step",description="number of frames to skip in +/- and prev/next")
+    parsers["step"].add_argument("n",type=int,help="number of frames to step")
+
+    parsers["colormap"] = ThrowingArgumentParser(prog="colormap", description="repeated sequence of groups of 4 numbers: V R G B ...")
+    parsers["colormap"].add_argument("name",type=str)
+    parsers["colormap"].add_argument("-P",dest="colormap", nargs=4,action='append',type=float, metavar=('V','R','G','B'))
+
+    parsers["atom_type"] = ThrowingArgumentParser(prog="atom_type")
+    parsers["atom_type"].add_argument("name",type=str)
+    group = parsers["atom_type"].add_mutually_exclusive_group()
+    group.add_argument("-color","-c",nargs=3,type=float,default=None, metavar=("R","G","B"))
+    group.add_argument("-colormap",nargs=2,type=str,default=None, metavar=("COLORMAP","FIELD"))
+    group = parsers["atom_type"].add_mutually_exclusive_group()
+    group.add_argument("-radius","-rad","-r",type=float,default=None)
+    group.add_argument("-radius_field",type=str,nargs=2,metavar=("RADIUS_FIELD","FACTOR"),default=None)
+    parsers["atom_type"].add_argument("-bonding_radius",type=float,default=None)
+    add_material_args_to_parser(parsers["atom_type"])
+
+    parsers["cell_box"] = ThrowingArgumentParser(prog="cell_box")
+    parsers["cell_box"].add_argument("-color",nargs=3,type=float,metavar=['R','G','B'], default=None)
+    parsers["cell_box"].add_argument("-opacity",type=float,default=None)
+    parsers["cell_box"].add_argument("-width",type=float,default=None)
+
+    parsers["picked"] = ThrowingArgumentParser(prog="picked")
+    parsers["picked"].add_argument("-color",nargs=3,type=float,metavar=['R','G','B'])
+
+    parsers["background_color"] = ThrowingArgumentParser(prog="background_color")
+    parsers["background_color"].add_argument("-color",nargs=3,type=float,metavar=['R','G','B'])
+
+    parsers["frame_label"] = ThrowingArgumentParser(prog="frame_label")
+    parsers["frame_label"].add_argument("-string","-s", type=str,nargs='+',
+        help="string, evaluating $( EXPRESSION ) and substituting ${STRING} with fields in atoms.info (or 'config_n'), or _NONE_", default=None)
+    parsers["frame_label"].add_argument("-color","-c", nargs=3,type=float,default=None, metavar=("R","G","B"))
+    parsers["frame_label"].add_argument("-fontsize",type=int,default=None)
+    group = parsers["frame_label"].add_mutually_exclusive_group()
+    group.add_argument("-on", action='store_true')
+    group.add_argument("-off", action='store_true')
+
+    parsers["atom_label"] = ThrowingArgumentParser(prog="atom_label")
+    parsers["atom_label"].add_argument("-string",type=str,help="string to use for label, evaluating $( EXPRESSION ) and substituting $${STRING} with fields in atoms.arrays "+
+                                                               "(or 'ID' for number of atom, 'Z' for atomic number, 'species' for chemical symbol), "+
+                                                               "or '_NONE_'", default=None)
+    parsers["atom_label"].add_argument("-color","-c",nargs=3,type=float,default=None, metavar=("R","G","B"))
+    parsers["atom_label"].add_argument("-fontsize",type=int,default=None)
+    group = parsers["atom_label"].add_mutually_exclusive_group()
+    group.add_argument("-on", action='store_true')
+    group.add_argument("-off", action='store_true')
+
+    return parsers
+
+_PARSERS = _build_parsers()
 
 class DavTKSettings(object):
     def __init__(self):
         self.data = { "atom_types" : DavTKAtomTypes(), "colormaps" : {},
-            "cell_box" : { "color" : [1.0, 1.0, 1.0], "opacity" : 1.0, "line_width" : 2.0, "prop" : None }, "background_color" : [0.0, 0.0, 0.0],
-            "picked" : { "color" : [1.0, 1.0, 0.0], "opacity" : 1.0,  "prop" : None },
-            "frame_label" : { "color" : [1.0, 1.0, 1.0], "fontsize" : 36, "prop" : None, "string" : "${config_n}", "show" : True },
-            "atom_label" : { "color" : [1.0, 1.0, 1.0], "fontsize" : 24 , "prop" : None, "string" : "$${ID}", "show" : False},
+            "cell_box" : { "color" : (1.0, 1.0, 1.0), "opacity" : 1.0, "line_width" : 2.0, "prop" : None }, "background_color" : (0.0, 0.0, 0.0),
+            "picked" : { "color" : (1.0, 1.0, 0.0), "opacity" : 1.0,  "prop" : None },
+            "frame_label" : { "color" : (1.0, 1.0, 1.0), "fontsize" : 36, "prop" : None, "string" : "${config_n}", "show" : True },
+            "atom_label" : { "color" : (1.0, 1.0, 1.0), "fontsize" : 24 , "prop" : None, "string" : "$${ID}", "show" : False},
             "frame_step" : 1, "legend" : { 'show' : False, 'position' : np.array([-10,-10]), 'spacing' : 1.0, 'sphere_scale' : 1.0 },
             'atom_type_field' : 'Z'
             }
 
         self.parsers = {}
 
-        self.parser_atom_type_field = ThrowingArgumentParser(prog="atom_type_field",description="ASE at.arrays field to use for atom type")
-        self.parser_atom_type_field.add_argument("field",type=str,help="name of field ('Z' for atomic numbers, 'species' for chemical symbols", default='Z')
-        self.parsers["atom_type_field"] = (self.parse_atom_type_field, self.parser_atom_type_field.format_usage(),
-                                           self.parser_atom_type_field.format_help(), self.write_atom_type_field)
-
-        self.parser_print_settings = ThrowingArgumentParser(prog="print_settings",description="print settings")
-        self.parser_print_settings.add_argument("-keyword_regexp",type=str)
-        self.parsers["print_settings"] = (self.parse_print_settings, self.parser_print_settings.format_usage(), self.parser_print_settings.format_help(), None)
-
-        self.parser_legend = ThrowingArgumentParser(prog="legend",description="control legend, toggle by default")
-        group = self.parser_legend.add_mutually_exclusive_group()
-        group.add_argument("-on",action='store_true',help="enable legend")
-        group.add_argument("-off",action='store_true',help="disable legend")
-        group = self.parser_legend.add_mutually_exclusive_group()
-        group.add_argument("-position",type=int,nargs=2,help="position relative to bottom left corner of display"+
-                                                             " (negative values relative to top right)", default=None)
-        group.add_argument("-offset",type=int,nargs=2,help="offset relative to current position", default=None)
-        self.parser_legend.add_argument("-spacing",type=float,help="multiplier for spacing between rows", default=None)
-        self.parser_legend.add_argument("-sphere_scale",action='store',type=float,help="scaling factor for sphere radius", default=None)
-        self.parsers["legend"] = (self.parse_legend, self.parser_legend.format_usage(), self.parser_legend.format_help(), self.write_legend)
-
-        self.parser_step = ThrowingArgumentParser(prog="step",description="number of frames to skip in +/- and prev/next")
-        self.parser_step.add_argument("n",type=int,help="number of frames to step")
-        self.parsers["step"] = (self.parse_step, self.parser_step.format_usage(), self.parser_step.format_help(), self.write_step)
-
-        self.parser_colormap = ThrowingArgumentParser(prog="colormap", description="repeated sequence of groups of 4 numbers: V R G B ...")
-        self.parser_colormap.add_argument("name",type=str)
-        self.parser_colormap.add_argument("-P",dest="colormap", nargs=4,action='append',type=float, metavar=('V','R','G','B'))
-        self.parsers["colormap"] = (self.parse_colormap, self.parser_colormap.format_usage(), self.parser_colormap.format_help(), self.write_colormap)
-
-        self.parser_atom_type = ThrowingArgumentParser(prog="atom_type")
-        self.parser_atom_type.add_argument("name",type=str)
-        group = self.parser_atom_type.add_mutually_exclusive_group()
-        group.add_argument("-color","-c",nargs=3,type=float,default=None, metavar=("R","G","B"))
-        group.add_argument("-colormap",nargs=2,type=str,default=None, metavar=("COLORMAP","FIELD"))
-        group = self.parser_atom_type.add_mutually_exclusive_group()
-        group.add_argument("-radius","-rad","-r",type=float,default=None)
-        group.add_argument("-radius_field",type=str,nargs=2,metavar=("RADIUS_FIELD","FACTOR"),default=None)
-        self.parser_atom_type.add_argument("-bonding_radius",type=float,default=None)
-        add_material_args_to_parser(self.parser_atom_type)
-        self.parsers["atom_type"] = (self.parse_atom_type, self.parser_atom_type.format_usage(), self.parser_atom_type.format_help(), self.write_atom_type)
-
-        self.parser_cell_box = ThrowingArgumentParser(prog="cell_box")
-        self.parser_cell_box.add_argument("-color",nargs=3,type=float,metavar=['R','G','B'], default=None)
-        self.parser_cell_box.add_argument("-opacity",type=float,default=None)
-        self.parser_cell_box.add_argument("-width",type=float,default=None)
-        self.parsers["cell_box"] = (self.parse_cell_box, self.parser_cell_box.format_usage(), self.parser_cell_box.format_help(),
-                                          self.write_cell_box)
-
-        self.parser_picked = ThrowingArgumentParser(prog="picked")
-        self.parser_picked.add_argument("-color",nargs=3,type=float,metavar=['R','G','B'])
-        self.parsers["picked"] = (self.parse_picked, self.parser_picked.format_usage(), self.parser_picked.format_help(),
-                                        self.write_picked)
-
-        self.parser_background_color = ThrowingArgumentParser(prog="background_color")
-        self.parser_background_color.add_argument("-color",nargs=3,type=float,metavar=['R','G','B'])
-        self.parsers["background_color"] = (self.parse_background_color, self.parser_background_color.format_usage(), self.parser_background_color.format_help(),
-                                            self.write_background_color)
-
-        self.parser_frame_label = ThrowingArgumentParser(prog="frame_label")
-        self.parser_frame_label.add_argument("-string","-s", type=str,nargs='+',
-            help="string, evaluating $( EXPRESSION ) and substituting ${STRING} with fields in atoms.info (or 'config_n'), or _NONE_", default=None)
-        self.parser_frame_label.add_argument("-color","-c", nargs=3,type=float,default=None, metavar=("R","G","B"))
-        self.parser_frame_label.add_argument("-fontsize",type=int,default=None)
-        group = self.parser_frame_label.add_mutually_exclusive_group()
-        group.add_argument("-on", action='store_true')
-        group.add_argument("-off", action='store_true')
-        self.parsers["frame_label"] = (self.parse_frame_label, self.parser_frame_label.format_usage(), self.parser_frame_label.format_help(),
-                                       self.write_frame_label)
-
-        self.parser_atom_label = ThrowingArgumentParser(prog="atom_label")
-        self.parser_atom_label.add_argument("-string",type=str,help="string to use for label, evaluating $( EXPRESSION ) and substituting $${STRING} with fields in atoms.arrays "+
-                                                                   "(or 'ID' for number of atom, 'Z' for atomic number, 'species' for chemical symbol), "+
-                                                                   "or '_NONE_'", default=None)
-        self.parser_atom_label.add_argument("-color","-c",nargs=3,type=float,default=None, metavar=("R","G","B"))
-        self.parser_atom_label.add_argument("-fontsize",type=int,default=None)
-        group = self.parser_atom_label.add_mutually_exclusive_group()
-        group.add_argument("-on", action='store_true')
-        group.add_argument("-off", action='store_true')
-        self.parsers["atom_label"] = (self.parse_atom_label, self.parser_atom_label.format_usage(), self.parser_atom_label.format_help(),
-                                      self.write_atom_label)
+        self.parser_atom_type_field = _PARSERS["atom_type_field"]
+        self.parsers["atom_type_field"] = ParserEntry(self.parse_atom_type_field, self.parser_atom_type_field, self.write_atom_type_field)
+
+        self.parser_print_settings = _PARSERS["print_settings"]
+        self.parsers["print_settings"] = ParserEntry(self.parse_print_settings, self.parser_print_settings)
+
+        self.parser_legend = _PARSERS["legend"]
+        self.parsers["legend"] = ParserEntry(self.parse_legend, self.parser_legend, self.write_legend)
+
+        self.parser_step = _PARSERS["step"]
+        self.parsers["step"] = ParserEntry(self.parse_step, self.parser_step, self.write_step)
+
+        self.parser_colormap = _PARSERS["colormap"]
+        self.parsers["colormap"] = ParserEntry(self.parse_colormap, self.parser_colormap, self.write_colormap)
+
+        self.parser_atom_type = _PARSERS["atom_type"]
+        self.parsers["atom_type"] = ParserEntry(self.parse_atom_type, self.parser_atom_type, self.write_atom_type)
+
+        self.parser_cell_box = _PARSERS["cell_box"]
+        self.parsers["cell_box"] = ParserEntry(self.parse_cell_box, self.parser_cell_box, self.write_cell_box)
+
+        self.parser_picked = _PARSERS["picked"]
+        self.parsers["picked"] = ParserEntry(self.parse_picked, self.parser_picked, self.write_picked)
+
+        self.parser_background_color = _PARSERS["background_color"]
+        self.parsers["background_color"] = ParserEntry(self.parse_background_color, self.parser_background_color, self.write_background_color)
+
+        self.parser_frame_label = _PARSERS["frame_label"]
+        self.parsers["frame_label"] = ParserEntry(self.parse_frame_label, self.parser_frame_label, self.write_frame_label)
+
+        self.parser_atom_label = _PARSERS["atom_label"]
+        self.parsers["atom_label"] = ParserEntry(self.parse_atom_label, self.parser_atom_label, self.write_atom_label)
 
         # properties
         # 3D Actor properties
@@ -220,8 +255,8 @@ class DavTKSettings(object):
 
     def write(self, fout, key_re=None):
         for keyword in self.parsers:
-            if (key_re is None or re.search(key_re, keyword)) and self.parsers[keyword][3] is not None:
-                fout.write(self.parsers[keyword][3]())
+            if (key_re is None or re.search(key_re, keyword)) and self.parsers[keyword].writer is not None:
+                fout.write(self.parsers[keyword].writer())
 
     def write_atom_type_field(self):
         args_str = 'atom_type_field'
@@ -292,7 +327,9 @@ class DavTKSettings(object):
         return args_str
     def parse_colormap(self, args):
         args = self.parser_colormap.parse_args(args)
-        self.data["colormaps"][args.name] = args.colormap
+        if args.colormap is None:
+            raise ValueError("colormap {} needs at least one -P V R G B point".format(args.name))
+        self.data["colormaps"][args.name] = Colormap(args.colormap)
         return "settings"
 
     def write_atom_type (self):
@@ -364,7 +401,7 @@ class DavTKSettings(object):
 
         got_setting = False
         if args.color is not None:
-            self.data["frame_label"]["color"] = args.color
+            self.data["frame_label"]["color"] = tuple(args.color)
             got_setting = True
         if args.fontsize is not None:
             self.data["frame_label"]["fontsize"] = args.fontsize
@@ -403,7 +440,7 @@ class DavTKSettings(object):
 
         got_setting = False
         if args.color is not None:
-            self.data["atom_label"]["color"] = args.color
+            self.data["atom_label"]["color"] = tuple(args.color)
             got_setting = True
         if args.fontsize is not None:
             self.data["atom_label"]["fontsize"] = args.fontsize
@@ -54,22 +54,27 @@ def get_atom_type_list(settings, at):
 
     return atom_type_list
 
+# properties returned by get_atom_prop, shared between callers with same color, so must not be modified
+_atom_props = {}
 def get_atom_prop(settings, atom_type, i=None, arrays=None):
-    prop = vtk.vtkProperty()
-    type_data = settings["atom_types"][atom_type]
+    color = settings["atom_types"][atom_type].color
+    key = tuple(color) if color is not None else None
 
-    # only set color for non-colormap, otherwise just default to white (maybe should use some point on colormap?)
-    if type_data["color"] is not None:
-        prop.SetColor(type_data["color"])
+    if key not in _atom_props:
+        prop = vtk.vtkProperty()
+        # only set color for non-colormap, otherwise just default to white (maybe should use some point on colormap?)
+        if color is not None:
+            prop.SetColor(color)
+        _atom_props[key] = prop
 
-    return prop
+    return _atom_props[key]
 
 def get_atom_radius(settings, atom_type, i, at=None):
-    if settings["atom_types"][atom_type]["radius_field"] is not None:
-        radius_field = settings["atom_types"][atom_type]["radius_field"][0]
+    type_data = settings["atom_types"][atom_type]
+    if type_data.radius_field is not None:
+        (radius_field, factor) = type_data.radius_field
         if radius_field not in at.arrays:
             raise RuntimeError("Atom radius field '{}' is not available".format(radius_field))
-        factor = settings["atom_types"][atom_type]["radius_field"][1]
         if isinstance(i, list):
             atom_type_list = i
             r = np.median([at.arrays[radius_field][ii] for ii in range(len(at)) if atom_type_list[ii] == atom_type])
@@ -77,7 +82,7 @@ def get_atom_radius(settings, atom_type, i, at=None):
             r = at.arrays[radius_field][i]
         r *= factor
     else:
-        r = settings["atom_types"][atom_type]["radius"]
+        r = type_data.radius
     if r is None:
         raise ValueError("Failed to find radius for atom type {}".format(atom_type))
     return r
@@ -106,10 +111,10 @@ class DavTKBonds(object):
         atom_type_list = get_atom_type_list(self.settings, self.at)
 
         if in_cutoff is None or len(in_cutoff) == 0: # fully auto
-            max_cutoff = max([none_zero(self.settings["atom_types"][atom_type_list[i]]["bonding_radius"]) for i in range(len(self.at))])
+            max_cutoff = max([none_zero(self.settings["atom_types"][atom_type_list[i]].bonding_radius) for i in range(len(self.at))])
             u_cutoff_min = lambda i1, i2 : 0.0
-            u_cutoff_max = lambda i1, i2 : 0.5 * ( self.settings["atom_types"][atom_type_list[i1]]["bonding_radius"] +
-                                                   self.settings["atom_types"][atom_type_list[i2]]["bonding_radius"] )
+            u_cutoff_max = lambda i1, i2 : 0.5 * ( self.settings["atom_types"][atom_type_list[i1]].bonding_radius +
+                                                   self.settings["atom_types"][atom_type_list[i2]].bonding_radius )
         elif len(in_cutoff) == 2: # min max
             max_cutoff = in_cutoff[1]
             u_cutoff_min = lambda i1, i2 : in_cutoff[0]
@@ -184,6 +189,11 @@ class DavTKBonds(object):
                     return
             raise ValueError("set_picked failed to find opposite for {} {}".format(i_at, j_at))
 
+    def unpick_all(self):
+        for b_set in self.bonds:
+            for b in b_set:
+                b["picked"] = False
+
     def delete_one(self, i_at, j_ind):
         b = self.bonds[i_at][j_ind]
         del self.bonds[i_at][j_ind]
@@ -249,6 +259,11 @@ class DaVTKState(object):
 
         self.frame_label_actor = None
 
+        # LUTs with the settings they were built from, reused while those are unchanged
+        self.luts = {}
+        self.lut_sources = {}
+        self.color_luts = {}
+
         self.saved_views = {}
 
         self.active = False
@@ -386,6 +401,14 @@ class DaVTKState(object):
         if what not in ["settings", "color_only", "rotate"]:
             self.set_frame(what)
 
+        self.refresh(what)
+
+    def update_frame(self, frame):
+        # like update(str(frame)), for absolute int frame, without parsing a string
+        self.cur_frame = frame % len(self.at_list)
+        self.refresh("cur")
+
+    def refresh(self, what):
         if not self.active:
             return
 
@@ -568,7 +591,7 @@ class DaVTKState(object):
             at_type = atom_type_list[i_at]
             r = get_atom_radius(self.settings, at_type, i_at, at)
 
-            colormap = self.settings["atom_types"][at_type]["colormap"]
+            colormap = self.settings["atom_types"][at_type].colormap
             if colormap is None: # fixed color
                 if picked_a[i_at]:
                     colormap_val = (1.0, 0.0, 0.0)
@@ -644,7 +667,7 @@ class DaVTKState(object):
             # add and save actor
             self.renderer.AddActor(actor)
             self.atoms_actors.append(actor)
-            actor.SetProperty(self.settings["atom_types"][at_type]["prop"])
+            actor.SetProperty(self.settings["atom_types"][at_type].prop)
 
     # need to see what can be optimized if settings_only is True
     # improve speed by using vtkProgrammableGlyphs like bonds?
@@ -1130,28 +1153,40 @@ class DaVTKState(object):
         for at_type in sorted(list(set(get_atom_type_list(self.settings, self.cur_at())))):
             s = self.settings["atom_types"][at_type]
 
-        self.luts = {}
-        # create true color maps
+        picked_color = tuple(self.settings["picked"]["color"])
+
+        luts = {}
+        # create true color maps, rebuilding only those whose points or picked color changed
         for (name, data) in self.settings["colormaps"].items():
-            lut = vtk.vtkColorTransferFunction()
-            lut.SetRange(data[0][0], data[-1][0])
-            for pt in data:
-                lut.AddRGBPoint(pt[0], pt[1], pt[2], pt[3])
-            lut.AddRGBPoint(data[-1][0]+1.0, self.settings["picked"]["color"][0], self.settings["picked"]["color"][1], self.settings["picked"]["color"][2])
-            self.luts[name] = lut
+            lut = self.luts.get(name)
+            if lut is None or self.lut_sources[name] != (data, picked_color):
+                lut = vtk.vtkColorTransferFunction()
+                lut.SetRange(data[0][0], data[-1][0])
+                for pt in data:
+                    lut.AddRGBPoint(pt[0], pt[1], pt[2], pt[3])
+                lut.AddRGBPoint(data[-1][0]+1.0, picked_color[0], picked_color[1], picked_color[2])
+                self.lut_sources[name] = (data, picked_color)
+            luts[name] = lut
+        self.luts = luts
 
         self.atom_type_luts = {}
         # create trivial color maps for fixed colors, or link to true maps
-        for name in self.settings["atom_types"].get_all():
-            color = self.settings["atom_types"][name]["color"]
-            if color is not None: # just a color
-                lut = vtk.vtkColorTransferFunction()
-                lut.SetRange(0,0)
-                lut.AddRGBPoint(0.0, color[0], color[1], color[2])
-                lut.AddRGBPoint(1.0, self.settings["picked"]["color"][0], self.settings["picked"]["color"][1], self.settings["picked"]["color"][2])
+        atom_types = self.settings["atom_types"]
+        for name in atom_types.get_all():
+            type_data = atom_types[name]
+            color = type_data.color
+            if color is not None: # just a color, shared by all types with same color
+                key = (tuple(color), picked_color)
+                lut = self.color_luts.get(key)
+                if lut is None:
+                    lut = vtk.vtkColorTransferFunction()
+                    lut.SetRange(0,0)
+                    lut.AddRGBPoint(0.0, color[0], color[1], color[2])
+                    lut.AddRGBPoint(1.0, picked_color[0], picked_color[1], picked_color[2])
+                    self.color_luts[key] = lut
                 self.atom_type_luts[name] = lut
-            elif self.settings["atom_types"][name]["colormap"] is not None:
-                self.atom_type_luts[name] = self.luts[self.settings["atom_types"][name]["colormap"][0]]
+            elif type_data.colormap is not None:
+                self.atom_type_luts[name] = self.luts[type_data.colormap[0]]
             else:
                 self.atom_type_luts[name] = None
 
@@ -1191,10 +1226,11 @@ class DaVTKState(object):
         IDs = list(range(len(at)))
         Zs = at.get_atomic_numbers()
         species = at.get_chemical_symbols()
+        labels = at.arrays.get("_vtk_label")
         for i_at in IDs:
             label_raw_string = None
-            if "_vtk_label" in at.arrays: # try per-atom value first
-                label_raw_string = at.arrays["_vtk_label"][i_at]
+            if labels is not None: # try per-atom value first
+                label_raw_string = labels[i_at]
                 if re.search('^\s*$', label_raw_string) or re.search('^"?\s*"?$', label_raw_string) or re.search("^'?\s*'?$", label_raw_string):
                     label_raw_string = None
             if label_raw_string is None: # use string from per-config or global setting
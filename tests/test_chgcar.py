@@ -0,0 +1,69 @@
+import numpy as np
+import ase
+import ase.io.vasp
+from ase.calculators.vasp import VaspChargeDensity
+
+import davtk.parse
+from davtk.parse import _read_vasp_charge_density, _read_chgcar
+
+def write_chgcar(filename, spin_polarized):
+    rng = np.random.default_rng(5)
+    at = ase.Atoms('SiO', positions=[[0, 0, 0], [1, 1, 1]],
+                   cell=[[4.0, 0.0, 0.0], [0.5, 4.2, 0.0], [0.3, 0.2, 4.5]], pbc=True)
+    chgcar = VaspChargeDensity(None)
+    chgcar.atoms = [at]
+    chgcar.chg = [rng.random((5, 6, 7))]
+    chgcar.aug = ('augmentation occupancies   1  2\n  0.1 0.2\n'
+                  'augmentation occupancies   2  2\n  0.3 0.4\n')
+    if spin_polarized:
+        chgcar.chgdiff = [rng.random((5, 6, 7)) - 0.5]
+        chgcar.augdiff = chgcar.aug
+    chgcar.write(filename, format='chgcar')
+
+def test_chgcar_spin_polarized(tmp_path):
+    filename = str(tmp_path / 'test.CHGCAR')
+    write_chgcar(filename, True)
+    ref = VaspChargeDensity(filename)
+
+    (chg, chgdiff) = _read_vasp_charge_density(filename, True)
+    assert chg.shape == ref.chg[0].shape
+    assert np.allclose(chg, ref.chg[0], rtol=1.0e-12, atol=0.0)
+    assert np.allclose(chgdiff, ref.chgdiff[0], rtol=1.0e-12, atol=0.0)
+
+    (chg, chgdiff) = _read_vasp_charge_density(filename, False)
+    assert np.allclose(chg, ref.chg[0], rtol=1.0e-12, atol=0.0)
+    assert chgdiff is None
+
+def test_chgcar_no_spin(tmp_path):
+    filename = str(tmp_path / 'test.CHGCAR')
+    write_chgcar(filename, False)
+    ref = VaspChargeDensity(filename)
+
+    (chg, chgdiff) = _read_vasp_charge_density(filename, True)
+    assert np.allclose(chg, ref.chg[0], rtol=1.0e-12, atol=0.0)
+    assert chgdiff is None
+
+def test_chgcar_fallback_old_ase(tmp_path, monkeypatch):
+    # older ase has no read_vasp_configuration, so the fast reader must not be used
+    filename = str(tmp_path / 'test.CHGCAR')
+    write_chgcar(filename, True)
+    # installed ase's own reader also needs it, so read the reference first
+    ref = VaspChargeDensity(filename)
+
+    monkeypatch.delattr(ase.io.vasp, 'read_vasp_configuration')
+    monkeypatch.setattr(davtk.parse, 'VaspChargeDensity', lambda f: ref)
+    (chg, chgdiff) = _read_chgcar(filename, True)
+    assert chg is ref.chg[0]
+    assert chgdiff is ref.chgdiff[0]
+
+def test_chgcar_fallback_fast_reader_error(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'test.CHGCAR')
+    write_chgcar(filename, False)
+    ref = VaspChargeDensity(filename)
+
+    def fail(filename, read_diff):
+        raise ValueError("unexpected format")
+    monkeypatch.setattr(davtk.parse, '_read_vasp_charge_density', fail)
+    (chg, chgdiff) = _read_chgcar(filename, True)
+    assert np.array_equal(chg, ref.chg[0])
+    assert chgdiff is None
@@ -0,0 +1,139 @@
+import itertools
+
+import numpy as np
+import pytest
+
+from davtk.Wavecar import Wavecar
+
+C = 0.262465831
+
+def g_points(a, encut, kpoint, gamma):
+    # all G within the cutoff, by brute force over a generous range
+    b = 2 * np.pi * np.linalg.inv(a).T
+    G = np.array(list(itertools.product(range(-8, 9), repeat=3)))
+    v = np.dot(kpoint + G, b)
+    mask = np.sum(v * v, axis=1) < encut * C
+    if gamma:
+        mask &= (G[:, 0] > 0) | ((G[:, 0] == 0) & ((G[:, 1] > 0) | ((G[:, 1] == 0) & (G[:, 2] >= 0))))
+    return G[mask]
+
+def write_wavecar(filename, spin, gamma, rtag):
+    # synthetic WAVECAR with random coefficients, returns coefficients written as [spin][kpoint] (nb, nplane) arrays
+    rng = np.random.default_rng(3)
+    a = np.array([[3.0, 0.0, 0.0], [0.5, 3.2, 0.0], [0.2, 0.3, 3.4]])
+    encut = 60.0
+    nb = 3
+    kpoints = [np.zeros(3)] if gamma else [np.zeros(3), np.array([0.25, 0.0, 0.5])]
+    nplanes = [len(g_points(a, encut, k, gamma)) for k in kpoints]
+    complex_words = 1 if rtag == 45200 else 2
+    recl8 = max(max(nplanes) * complex_words, 4 + 3 * nb, 13)
+
+    def record(values):
+        rec = np.zeros(recl8)
+        rec[:len(values)] = values
+        return rec
+
+    records = [record([recl8 * 8, spin, rtag]),
+               record(np.concatenate(([len(kpoints), nb, encut], a.ravel(), [1.5])))]
+    coeffs = []
+    for ispin in range(spin):
+        coeffs.append([])
+        for (k, nplane) in zip(kpoints, nplanes):
+            enocc = rng.random((nb, 3))
+            records.append(record(np.concatenate(([nplane], k, enocc.ravel()))))
+            c = rng.random((nb, nplane)) - 0.5 + 1j * (rng.random((nb, nplane)) - 0.5)
+            c = c.astype(np.complex64 if rtag == 45200 else np.complex128)
+            coeffs[-1].append(c)
+            for band_c in c:
+                records.append(record(band_c.view(np.float64)))
+    np.concatenate(records).tofile(filename)
+    return coeffs
+
+@pytest.mark.parametrize("spin,gamma,rtag", [(1, False, 45200), (2, False, 45200), (1, True, 45200), (1, False, 45210)])
+def test_wavecar(tmp_path, spin, gamma, rtag):
+    filename = str(tmp_path / 'WAVECAR')
+    written = write_wavecar(filename, spin, gamma, rtag)
+
+    eager = Wavecar(filename)
+    lazy = Wavecar(filename, lazy=True)
+    half = Wavecar(filename, half_precision_coeffs=True)
+
+    assert eager.gamma == gamma
+    for ink in range(eager.nk):
+        for wf in [lazy, half]:
+            assert np.array_equal(wf.Gpoints[ink], eager.Gpoints[ink])
+        G_ref = g_points(eager.a, eager.encut, eager.kpoints[ink], gamma)
+        nplane = len(G_ref)
+        assert set(map(tuple, eager.Gpoints[ink][:nplane])) == set(map(tuple, G_ref))
+
+        for ispin in range(spin):
+            c = eager._get_coeffs(ink, slice(None), spin=ispin)
+            if not gamma:
+                assert np.array_equal(c, written[ispin][ink])
+            assert np.array_equal(lazy._get_coeffs(ink, slice(None), spin=ispin), c)
+            assert np.allclose(half._get_coeffs(ink, slice(None), spin=ispin), c, rtol=0.0, atol=1.0e-3)
+
+            for band in range(eager.nb):
+                mesh = eager.fft_mesh(ink, band, spin=ispin)
+                assert np.array_equal(lazy.fft_mesh(ink, band, spin=ispin), mesh)
+                assert np.allclose(half.fft_mesh(ink, band, spin=ispin), mesh, rtol=0.0, atol=1.0e-3)
+                # every coefficient is placed on the mesh
+                assert np.isclose(np.sum(np.abs(mesh)**2), np.sum(np.abs(c[band])**2), rtol=1.0e-5)
+
+def parchg_reference(wf, kpoint, bands, spin, phase, scale):
+    # summed per-band |ifftn(fft_mesh)|^2 on the scaled grid
+    temp_ng = wf.ng
+    wf.ng = wf.ng * scale
+    N = np.prod(wf.ng)
+    den = np.zeros(wf.ng)
+    for band in bands:
+        wfr = np.fft.ifftn(wf.fft_mesh(kpoint, band, spin=spin).astype(np.complex128)) * N
+        den += np.abs(wfr)**2
+        if phase:
+            den *= np.sign(wfr.real)
+    wf.ng = temp_ng
+    return den
+
+@pytest.mark.parametrize("spin,gamma", [(1, False), (2, False), (1, True)])
+def test_parchg(tmp_path, spin, gamma):
+    filename = str(tmp_path / 'WAVECAR')
+    write_wavecar(filename, spin, gamma, 45200)
+    wf = Wavecar(filename)
+    ng = wf.ng.copy()
+
+    def check(data, ref):
+        assert data.shape == ref.shape
+        assert np.allclose(data, ref, rtol=1.0e-4, atol=1.0e-4 * np.max(np.abs(ref)))
+
+    bands = [0, 2]
+    if spin == 2:
+        data = wf.get_parchg_data(0, bands)
+        up = parchg_reference(wf, 0, bands, 0, False, 2)
+        down = parchg_reference(wf, 0, bands, 1, False, 2)
+        check(data['total'], up + down)
+        check(data['diff'], up - down)
+        check(wf.get_parchg_data(0, bands, spin=1)['total'], down)
+    else:
+        check(wf.get_parchg_data(0, bands)['total'], parchg_reference(wf, 0, bands, 0, False, 2))
+        check(wf.get_parchg_data(0, bands, scale=1)['total'], parchg_reference(wf, 0, bands, 0, False, 1))
+
+        data = wf.get_parchg_data(0, 1, phase=True)['total']
+        ref = parchg_reference(wf, 0, [1], 0, True, 2)
+        check(data, ref)
+        assert np.any(data < 0.0)
+
+        with pytest.raises(ValueError):
+            wf.get_parchg_data(0, bands, phase=True)
+    assert np.array_equal(wf.ng, ng)
+
+def test_evaluate_wavefunc_gcart(tmp_path):
+    filename = str(tmp_path / 'WAVECAR')
+    write_wavecar(filename, 1, False, 45200)
+    wf = Wavecar(filename)
+    wf_gcart = Wavecar(filename, cache_gcart=True)
+    assert wf.Gcart is None
+
+    r = np.random.default_rng(7).random((4, 3)) * 3.0
+    for ink in range(wf.nk):
+        assert np.allclose(wf.evaluate_wavefunc(ink, 1, r), wf_gcart.evaluate_wavefunc(ink, 1, r), rtol=1.0e-5)
+        assert np.allclose(wf.evaluate_wavefunc(ink, 1, r[0]), wf_gcart.evaluate_wavefunc(ink, 1, r[0]), rtol=1.0e-5)